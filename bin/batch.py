@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# PULFA PDF Harvester, batch mode
+# Runs every EAD under the given directories (or just the given EAD files)
+# through main.py's pipeline in one long-lived process, so that interpreter,
+# libxml2 and configuration start-up are paid once and the download,
+# conversion and encoding pools are shared by all of them.
+#
+# Only EADs modified since the last run (the mtime of the --last-run file) are
+# processed. The file is touched when the batch finishes.
+#
+# Usage (from the bin directory, like main.py):
+#  python ./batch.py [--last-run .last_run] [--resume] [--dry-run] /path/to/eads [/path/to/MC216.EAD.xml ...]
+#
+#===============================================================================
+
+from argparse import ArgumentParser
+from multiprocessing.pool import ThreadPool
+import main
+import os
+
+def find_eads(paths, since=None):
+	"""
+	Return a sorted list of the EAD (*.xml) files at or under paths, limited to
+	those modified after since (seconds since the epoch) if it is given.
+	"""
+	eads = []
+	for path in paths:
+		if os.path.isfile(path):
+			candidates = [path]
+		else:
+			candidates = []
+			for dirpath, dirnames, filenames in os.walk(path):
+				for f in filenames:
+					if f.endswith('.xml'):
+						candidates.append(os.path.join(dirpath, f))
+		for ead in candidates:
+			if since is None or os.path.getmtime(ead) > since:
+				eads.append(ead)
+	eads.sort()
+	return eads
+
+def run_ead(ead, resume=False, dry_run=False):
+	"""
+	Run one EAD, logging rather than raising any error so that the rest of the
+	batch carries on. Returns True if it succeeded.
+	"""
+	main.logr.info('Starting ' + ead)
+	try:
+		main.process_ead(ead, resume, dry_run)
+		main.logr.info('Finished ' + ead)
+		return True
+	except Exception:
+		main.logr.exception('Failed ' + ead)
+		return False
+
+if __name__ == '__main__':
+	parser = ArgumentParser()
+	parser.add_argument("--last-run", default=".last_run", dest="last_run")
+	parser.add_argument("--resume", action="store_true", dest="resume")
+	parser.add_argument("--dry-run", action="store_true", dest="dry_run")
+	parser.add_argument("paths", nargs="+")
+	args = parser.parse_args()
+
+	main._setup()
+
+	since = None
+	if os.path.exists(args.last_run):
+		since = os.path.getmtime(args.last_run)
+
+	eads = find_eads(args.paths, since)
+	main.logr.info(str(len(eads)) + ' EAD(s) to process, ' + str(main.EAD_WORKERS) + ' at a time')
+
+	pool = ThreadPool(main.EAD_WORKERS)
+	try:
+		results = pool.map(lambda ead: run_ead(ead, args.resume, args.dry_run), eads)
+	finally:
+		pool.close()
+		pool.join()
+
+	main.report_stats('batch')
+
+	failed = [ead for ead, ok in zip(eads, results) if not ok]
+	for ead in failed:
+		main.logr.error('Failed: ' + ead)
+
+	# touch
+	open(args.last_run, 'a').close()
+	os.utime(args.last_run, None)
+
+	os.sys.exit(len(failed) > 0)
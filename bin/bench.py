@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# PULFA PDF Harvester, benchmarks
+# Makes a synthetic EAD (with as many daos, nested as deeply, as you like) and
+# multi-page PDFs of 1, 8 and 24 bit pages to go with it, serves the PDFs from
+# a local HTTP server, and times main.py's steps on them: get_pdfs (with the
+# downloads), extract_bitmaps_from_pdf and bitmaps_to_tiff (or pdf_to_tiff),
+# tiffs_to_jp2 (unless the JP2s are fused; see --path below), 
+# pdf_obj_to_mets, finalize and update_ead one at a time, and then 
+# process_ead end to end. No real finding aids or production mounts are 
+# touched: every root directory is pointed at the benchmark's own work dir.
+#
+# --path picks the way pages are made, whatever etc/main.conf says, so that
+# each can be timed against its own history:
+#  * legacy: extract_bitmaps_from_pdf, bitmaps_to_tiff, then tiffs_to_jp2
+#  * direct: pdf_to_tiff, then tiffs_to_jp2
+#  * fused: pdf_to_tiff, making the JP2s along with the TIFFs
+#
+# Each run is appended (as a line of JSON) to the results file, and compared
+# with the last run with the same settings.
+#
+# Usage (from the bin directory, like main.py):
+#  python ./bench.py [--daos 12] [--depth 3] [--pages 4] [--size 1275x1650]
+#                    [--path legacy|direct|fused] [--results ../log/bench.jsonl]
+#                    [--keep]
+#
+# Dependencies (as main.py), plus:
+#  * PIL with multi-page PDF support (Pillow >= 3.0)
+#
+#===============================================================================
+
+from PIL import Image, ImageDraw
+from SimpleHTTPServer import SimpleHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from BaseHTTPServer import HTTPServer
+from argparse import ArgumentParser
+from cache import DownloadCache
+from shutil import copy, rmtree
+import json
+import main
+import os
+import random
+import subprocess
+import tempfile
+import threading
+import time
+
+EAD_ID = 'BENCH'
+
+# the bit depths the PDFs cycle through (pdfimages makes .pbm, .pgm, .ppm)
+MODES = ('1', 'L', 'RGB')
+
+WORDS = ('the', 'letter', 'from', 'committee', 'report', 'princeton', 'university',
+	'papers', 'correspondence', 'annual', 'meeting', 'minutes', 'board', 'trustees')
+
+#
+# Synthetic data
+#
+
+def make_page(size, mode, rotation, rand):
+	"""
+	A page of (random) typed text in the given PIL mode, turned by rotation
+	degrees so that there is something for orientation to do.
+	"""
+	im = Image.new('L', size, 255)
+	draw = ImageDraw.Draw(im)
+	y = 40
+	while y < size[1] - 40:
+		line = ' '.join(rand.choice(WORDS) for i in range(12))
+		draw.text((40, y), line, fill=0)
+		y += 18
+	if rotation: im = im.rotate(rotation, expand=True)
+	if mode == 'RGB':
+		im = Image.merge('RGB', (im, im.point(lambda v: int(v * 0.9)), im.point(lambda v: int(v * 0.8))))
+	elif mode == '1':
+		im = im.convert('1')
+	return im
+
+def make_pdf(path, pages, size, mode, rand):
+	"""
+	A PDF of pages pages, one image each.
+	"""
+	ims = [make_page(size, mode, rand.choice((0, 0, 0, 90, 180)), rand) for p in range(pages)]
+	ims[0].save(path, 'PDF', resolution=150.0, save_all=True, append_images=ims[1:])
+
+def make_ead(path, base_url, daos, depth):
+	"""
+	An EAD with daos components (each with one PDF dao), nested depth deep.
+	Returns the list of PDF names the daos point at.
+	"""
+	names = []
+	lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+		'<ead xmlns="' + main._EAD_NS + '" xmlns:xlink="' + main._XLINK_NS + '">',
+		'<eadheader><eadid>' + EAD_ID + '</eadid></eadheader>',
+		'<archdesc level="collection"><did><unittitle>Benchmark Papers</unittitle></did><dsc>']
+
+	# spread the daos over a tree of components, depth levels deep
+	open_levels = 0
+	for i in range(daos):
+		level = (i % depth) + 1
+		while open_levels >= level:
+			lines.append('</c>')
+			open_levels -= 1
+		while open_levels < level - 1: # an intermediate level, without a dao
+			open_levels += 1
+			lines.append('<c level="series"><did><unittitle>Series ' + str(i) + '</unittitle></did>')
+		c_id = EAD_ID + '_c' + str(i + 1).zfill(4)
+		name = c_id + '.pdf'
+		names.append(name)
+		lines.append('<c id="' + c_id + '" level="file"><did>')
+		lines.append('<unittitle>Folder ' + str(i + 1) + '</unittitle><unitdate>19' + str(10 + i % 90) + '</unitdate>')
+		lines.append('<dao xlink:type="simple" xlink:href="' + base_url + name + '"/>')
+		lines.append('</did>')
+		open_levels += 1
+	while open_levels > 0:
+		lines.append('</c>')
+		open_levels -= 1
+
+	lines.append('</dsc></archdesc></ead>')
+	f = open(path, 'w')
+	try:
+		f.write('\n'.join(lines) + '\n')
+	finally:
+		f.close()
+	return names
+
+#
+# A stand-in for the server the PDFs really come from
+#
+
+class _Server(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+def serve(dir):
+	"""
+	Serve dir over HTTP on a free local port, in a background thread. Returns
+	(server, base URL).
+	"""
+	class Handler(SimpleHTTPRequestHandler):
+		def translate_path(self, path):
+			return os.path.join(dir, os.path.basename(path.split('?')[0]))
+		def log_message(self, format, *args):
+			pass
+	server = _Server(('127.0.0.1', 0), Handler)
+	t = threading.Thread(target=server.serve_forever)
+	t.daemon = True
+	t.start()
+	return server, 'http://127.0.0.1:' + str(server.server_address[1]) + '/'
+
+#
+# Timing
+#
+
+def point_roots(work):
+	"""
+	Make main.py read and write everything under work.
+	"""
+	for name in ('TIFFS_LOCAL_ROOT', 'TIFFS_FINAL_ROOT', 'PDFS_LOCAL_ROOT', 'PDFS_FINAL_ROOT',
+			'JP2S_LOCAL_ROOT', 'JP2S_FINAL_ROOT', 'METS_LOCAL_ROOT', 'METS_FINAL_ROOT',
+			'BITMAPS_ROOT', 'TMP_DIR', 'STATS_DIR'):
+		path = os.path.join(work, name.lower())
+		if not os.path.exists(path): os.makedirs(path, 0755)
+		setattr(main, name, path)
+
+	# and remember downloads in a cache of its own, not the real one
+	main.CACHE.close()
+	main.CACHE = DownloadCache(os.path.join(work, 'downloads.db'))
+
+# --path -> (main.DIRECT_TIFFS, main.FUSED_JP2S)
+PATHS = {'legacy': (False, False), 'direct': (True, False), 'fused': (True, True)}
+
+def choose_path(path):
+	"""
+	Make main.py make pages the given way (see PATHS), or, if path is None, 
+	the way its config says. Returns the name of the path.
+	"""
+	if path is None:
+		for name, flags in PATHS.items():
+			if flags == (main.DIRECT_TIFFS, main.FUSED_JP2S): return name
+		return 'legacy' # fused without direct: bitmaps_to_tiff makes the JP2s too
+	main.DIRECT_TIFFS, main.FUSED_JP2S = PATHS[path]
+	if main.FUSED_JP2S and main.TIFF_ENGINE != 'pil':
+		raise SystemExit('--path fused needs [tiffs] engine=pil')
+	return path
+
+def timed(timings, name, function, *args):
+	start = time.time()
+	result = function(*args)
+	timings[name] = timings.get(name, 0.0) + time.time() - start
+	return result
+
+def run_steps(ead, work):
+	"""
+	Time each step on its own, for all of the PDFs, in order. Returns a dict
+	of step -> seconds.
+	"""
+	point_roots(work)
+	timings = {}
+	pdf_objs = timed(timings, 'get_pdfs', main.get_pdfs, ead)
+	if main.DIRECT_TIFFS:
+		steps = [('pdf_to_tiff', lambda pdf_obj: main.pdf_to_tiff(pdf_obj, main.TMP_DIR))]
+	else:
+		steps = [('extract_bitmaps_from_pdf', main.extract_bitmaps_from_pdf),
+			('bitmaps_to_tiff', main.bitmaps_to_tiff)]
+	if not main.FUSED_JP2S: # otherwise made along with the TIFFs
+		steps.append(('tiffs_to_jp2', main.tiffs_to_jp2))
+	steps.append(('pdf_obj_to_mets', lambda pdf_obj: main.pdf_obj_to_mets(pdf_obj, main.TMP_DIR)))
+	for step, function in steps:
+		for pdf_obj in pdf_objs:
+			timed(timings, step, function, pdf_obj)
+	timed(timings, 'finalize', main.finalize, pdf_objs)
+	timed(timings, 'update_ead', main.update_ead, ead, pdf_objs)
+	return timings
+
+def run_end_to_end(ead, work):
+	"""
+	Time process_ead. Returns seconds.
+	"""
+	point_roots(work)
+	start = time.time()
+	main.process_ead(ead)
+	return time.time() - start
+
+def revision():
+	"""
+	The git revision we're benchmarking, if we can tell.
+	"""
+	try:
+		proc = subprocess.Popen(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		out, err = proc.communicate()
+		if proc.returncode == 0: return out.strip()
+	except OSError:
+		pass
+	return None
+
+def previous(results_path, params):
+	"""
+	The last result in results_path run with the same params, or None.
+	"""
+	if not os.path.exists(results_path): return None
+	last = None
+	f = open(results_path)
+	try:
+		for line in f:
+			result = json.loads(line)
+			if result.get('params') == params: last = result
+	finally:
+		f.close()
+	return last
+
+def report(result, last):
+	print '%-26s %10s %10s %8s' % ('', 'seconds', 'last', 'change')
+	rows = sorted(result['steps'].items()) + [('end to end', result['end_to_end'])]
+	for name, seconds in rows:
+		before = None
+		if last is not None:
+			if name == 'end to end': before = last.get('end_to_end')
+			else: before = last['steps'].get(name)
+		if before: change = '%+7.1f%%' % ((seconds - before) / before * 100)
+		else: change = '-'
+		print '%-26s %10.2f %10s %8s' % (name, seconds, '%.2f' % before if before else '-', change)
+	if last is not None:
+		print '(last: ' + str(last.get('revision')) + ' at ' + time.ctime(last['time']) + ')'
+
+if __name__ == '__main__':
+	parser = ArgumentParser()
+	parser.add_argument("--daos", type=int, default=12, dest="daos")
+	parser.add_argument("--depth", type=int, default=3, dest="depth")
+	parser.add_argument("--pages", type=int, default=4, dest="pages")
+	parser.add_argument("--size", default="1275x1650", dest="size")
+	parser.add_argument("--seed", type=int, default=1, dest="seed")
+	parser.add_argument("--path", choices=sorted(PATHS), default=None, dest="path")
+	parser.add_argument("--results", default="../log/bench.jsonl", dest="results")
+	parser.add_argument("--keep", action="store_true", dest="keep")
+	args = parser.parse_args()
+	size = tuple(int(n) for n in args.size.split('x'))
+	main._setup()
+	path = choose_path(args.path)
+	params = {'daos': args.daos, 'depth': args.depth, 'pages': args.pages, 'size': args.size, 
+		'seed': args.seed, 'path': path, 'direct': main.DIRECT_TIFFS, 'fused': main.FUSED_JP2S}
+
+	work = tempfile.mkdtemp(prefix='pulfa-bench-')
+	pdfs_dir = os.path.join(work, 'served')
+	os.makedirs(pdfs_dir)
+	server, base_url = serve(pdfs_dir)
+	try:
+		rand = random.Random(args.seed)
+		ead = os.path.join(work, EAD_ID + '.EAD.xml')
+		names = make_ead(ead, base_url, args.daos, args.depth)
+		for i, name in enumerate(names):
+			make_pdf(os.path.join(pdfs_dir, name), args.pages, size, MODES[i % len(MODES)], rand)
+		pristine = ead + '.orig'
+		copy(ead, pristine)
+		main.logr.info('benchmarking ' + str(len(names)) + ' PDFs of ' + str(args.pages) + ' pages (' + path + ') in ' + work)
+
+		# each step on its own...
+		steps = run_steps(ead, os.path.join(work, 'steps'))
+
+		# ...and all together, from scratch
+		copy(pristine, ead)
+		end_to_end = run_end_to_end(ead, os.path.join(work, 'end_to_end'))
+
+		result = {'time': time.time(), 'revision': revision(), 'params': params,
+			'steps': steps, 'end_to_end': end_to_end,
+			'stages': main.STATS.summary()['stages']}
+		last = previous(args.results, params)
+
+		results_dir = os.path.dirname(os.path.abspath(args.results))
+		if not os.path.exists(results_dir): os.makedirs(results_dir, 0755)
+		f = open(args.results, 'a')
+		try:
+			f.write(json.dumps(result, sort_keys=True) + '\n')
+		finally:
+			f.close()
+
+		report(result, last)
+	finally:
+		server.shutdown()
+		if args.keep: print 'kept ' + work
+		else: rmtree(work)
+
+	os.sys.exit(0)
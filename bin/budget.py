@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# Admission control for main.py's page workers: each page (or JP2 encode)
+# claims an estimate of the memory it will need before it starts, and waits
+# while that won't fit in what's left of a budget shared by every pool. Small
+# bitonal pages fit many at a time, so they run as fast as the pools allow;
+# big colour scans are let in a few (or one) at a time.
+#
+# Claims are admitted in the order they're made, so a big page isn't starved
+# by a stream of small ones behind it.
+#
+#===============================================================================
+
+import os
+import threading
+
+def physical_memory():
+	"""
+	Bytes of RAM on this machine, or None if we can't tell.
+	"""
+	try:
+		return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+	except (ValueError, OSError, AttributeError):
+		return None
+
+class MemoryBudget(object):
+	"""
+	A budget of bytes, claimed and released by any number of threads. A
+	budget of 0 (or less) admits everything at once.
+	"""
+	def __init__(self, budget):
+		self.budget = budget
+		self.used = 0
+		self.cond = threading.Condition()
+		self.next_ticket = 0
+		self.serving = 0
+
+	def acquire(self, cost):
+		"""
+		Block until cost bytes fit in what's left of the budget (and every
+		earlier claim has been admitted), and claim them. Returns what was
+		claimed, for release: a claim bigger than the whole budget is let in
+		on its own, as the whole budget.
+		"""
+		if self.budget <= 0: return 0
+		cost = max(0, min(cost, self.budget))
+		self.cond.acquire()
+		try:
+			ticket = self.next_ticket
+			self.next_ticket += 1
+			while ticket != self.serving or self.used + cost > self.budget:
+				self.cond.wait()
+			self.used += cost
+			self.serving += 1
+			self.cond.notify_all()
+			return cost
+		finally:
+			self.cond.release()
+
+	def release(self, cost):
+		"""
+		Give back what acquire claimed.
+		"""
+		if not cost: return
+		self.cond.acquire()
+		try:
+			self.used -= cost
+			self.cond.notify_all()
+		finally:
+			self.cond.release()
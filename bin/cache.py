@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# What main.py knows about every PDF it has tried to download, across runs:
+# an SQLite database with one row per dao href, with the HTTP status we got,
+# and, for PDFs we have, the ETag, Last-Modified, size and SHA-1 of our copy.
+# That's enough to ask the server "has it changed?" instead of fetching the
+# PDF again, and to leave links we know to be dead alone for a while.
+#
+#===============================================================================
+
+import os
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS downloads (
+	src_url TEXT PRIMARY KEY,
+	status INTEGER NOT NULL,
+	etag TEXT,
+	last_modified TEXT,
+	size INTEGER,
+	checksum TEXT,
+	path TEXT,
+	checked REAL NOT NULL
+);
+"""
+
+class Download():
+	"""
+	A row from the cache.
+	"""
+	def __init__(self, row):
+		(self.src_url, self.status, self.etag, self.last_modified, self.size,
+			self.checksum, self.path, self.checked) = row
+		for attr in ('src_url', 'etag', 'last_modified', 'checksum', 'path'):
+			value = getattr(self, attr)
+			if isinstance(value, unicode): setattr(self, attr, value.encode('utf-8'))
+
+	def is_ours(self, path):
+		"""
+		True if the file at path is still the one we downloaded (as far as we
+		can tell without reading it).
+		"""
+		return (self.status == 200 and self.path == path and os.path.exists(path)
+			and os.path.getsize(path) == self.size)
+
+	def validators(self):
+		"""
+		Headers for a conditional GET of this PDF.
+		"""
+		headers = {}
+		if self.etag: headers['If-None-Match'] = self.etag
+		if self.last_modified: headers['If-Modified-Since'] = self.last_modified
+		return headers
+
+class DownloadCache(object):
+	"""
+	The download cache. Safe to use from any number of threads.
+	"""
+	def __init__(self, path):
+		dir = os.path.dirname(path)
+		if not os.path.exists(dir):
+			os.makedirs(dir, 0755)
+		self.path = path
+		self.conn = sqlite3.connect(path, check_same_thread=False)
+		self.conn.executescript(_SCHEMA)
+		self.lock = threading.Lock()
+
+	def get(self, src_url):
+		"""
+		The Download for src_url, or None.
+		"""
+		self.lock.acquire()
+		try:
+			row = self.conn.execute("SELECT * FROM downloads WHERE src_url = ?", (src_url,)).fetchone()
+		finally:
+			self.lock.release()
+		if row is None: return None
+		return Download(row)
+
+	def put(self, src_url, status, etag=None, last_modified=None, size=None, checksum=None, path=None):
+		"""
+		Record what we got for src_url, now.
+		"""
+		self.lock.acquire()
+		try:
+			with self.conn:
+				self.conn.execute("INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+					(src_url, status, etag, last_modified, size, checksum, path, time.time()))
+		finally:
+			self.lock.release()
+
+	def touch(self, src_url):
+		"""
+		Note that src_url was checked (and hadn't changed) now.
+		"""
+		self.lock.acquire()
+		try:
+			with self.conn:
+				self.conn.execute("UPDATE downloads SET checked = ? WHERE src_url = ?", (time.time(), src_url))
+		finally:
+			self.lock.release()
+
+	def close(self):
+		self.conn.close()
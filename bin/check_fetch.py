@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# PULFA PDF Harvester, a check of fetch.py against a local stub server
+# Serves a few misbehaving URLs from 127.0.0.1 and makes sure that Fetcher
+# copes with each:
+#
+#  * /flaky: 503 (with Retry-After: 0) twice, then 200 -> retried until it works
+#  * /down: always 503 -> handle gets the last 503, after every retry
+#  * /stall: headers never come -> read timeout, retried, then raised
+#  * /trickle: headers, then the body stops -> timeout while handle reads it,
+#    retried along with the request, then raised
+#  * /busy: a slow 200 -> never more than host_workers in flight at once, and
+#    no more than host_rate started a second
+#
+# Usage (from the bin directory, like main.py):
+#  python ./check_fetch.py
+#
+# Prints a line per check and exits 1 if any of them failed.
+#
+#===============================================================================
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from fetch import Fetcher
+import requests
+import sys
+import threading
+import time
+
+FLAKY_FAILURES = 2
+STALL = 1.0 # seconds the slow URLs hold out, well over READ_TIMEOUT
+READ_TIMEOUT = 0.3
+RETRIES = 2
+HOST_WORKERS = 2
+HOST_RATE = 20
+
+class _Stub(BaseHTTPRequestHandler):
+	lock = threading.Lock()
+	hits = {}
+	in_flight = 0
+	most_in_flight = 0
+	starts = []
+
+	def _count(self):
+		_Stub.lock.acquire()
+		try:
+			_Stub.hits[self.path] = _Stub.hits.get(self.path, 0) + 1
+			return _Stub.hits[self.path]
+		finally:
+			_Stub.lock.release()
+
+	def _reply(self, status, body='', headers={}):
+		self.send_response(status)
+		self.send_header('Content-Length', str(len(body)))
+		for name, value in headers.items():
+			self.send_header(name, value)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_GET(self):
+		hit = self._count()
+		try:
+			if self.path == '/flaky':
+				if hit <= FLAKY_FAILURES: self._reply(503, 'busy', {'Retry-After': '0'})
+				else: self._reply(200, 'ok')
+			elif self.path == '/down':
+				self._reply(503, 'down')
+			elif self.path == '/stall':
+				time.sleep(STALL)
+				self._reply(200, 'late')
+			elif self.path == '/trickle':
+				self.send_response(200)
+				self.send_header('Content-Length', '10')
+				self.end_headers()
+				self.wfile.write('ab')
+				self.wfile.flush()
+				time.sleep(STALL)
+				self.wfile.write('cdefghij')
+			elif self.path == '/busy':
+				_Stub.lock.acquire()
+				try:
+					_Stub.starts.append(time.time())
+					_Stub.in_flight += 1
+					_Stub.most_in_flight = max(_Stub.most_in_flight, _Stub.in_flight)
+				finally:
+					_Stub.lock.release()
+				try:
+					time.sleep(0.2)
+					self._reply(200, 'ok')
+				finally:
+					_Stub.lock.acquire()
+					_Stub.in_flight -= 1
+					_Stub.lock.release()
+			else:
+				self._reply(404)
+		except IOError:
+			pass # the client gave up on us, as it should
+
+	def log_message(self, format, *args):
+		pass
+
+class _Server(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+	def handle_error(self, request, client_address):
+		pass # broken pipes from the clients that timed out, as they should
+
+class _Log(object):
+	"""
+	Collects the retries Fetcher reports.
+	"""
+	def __init__(self):
+		self.retries = []
+	def warn(self, msg):
+		self.retries.append(msg)
+
+def _body(resp):
+	return resp.status_code, resp.content
+
+def check(name, ok, detail):
+	print '%-8s %-5s %s' % (name, 'ok' if ok else 'FAIL', detail)
+	return ok
+
+def run(base_url):
+	fetcher = Fetcher(requests.Session(), connect_timeout=1, read_timeout=READ_TIMEOUT,
+		retries=RETRIES, backoff=0.01, max_backoff=0.05, host_workers=HOST_WORKERS, host_rate=HOST_RATE)
+	results = []
+
+	log = _Log()
+	status, body = fetcher.fetch(base_url + 'flaky', _body, log=log)
+	results.append(check('flaky', status == 200 and len(log.retries) == FLAKY_FAILURES,
+		'HTTP %d after %d retries' % (status, len(log.retries))))
+
+	log = _Log()
+	status, body = fetcher.fetch(base_url + 'down', _body, log=log)
+	results.append(check('down', status == 503 and len(log.retries) == RETRIES,
+		'HTTP %d after %d retries' % (status, len(log.retries))))
+
+	for path in ('stall', 'trickle'):
+		log = _Log()
+		start = time.time()
+		try:
+			fetcher.fetch(base_url + path, _body, log=log)
+			error = None
+		except requests.exceptions.RequestException, e:
+			error = e.__class__.__name__
+		elapsed = time.time() - start
+		results.append(check(path, error is not None and len(log.retries) == RETRIES
+			and elapsed < (RETRIES + 1) * STALL,
+			'%s after %d retries in %.1fs' % (error, len(log.retries), elapsed)))
+
+	threads = [threading.Thread(target=fetcher.fetch, args=(base_url + 'busy', _body)) for i in range(6)]
+	for t in threads: t.start()
+	for t in threads: t.join()
+	starts = sorted(_Stub.starts)
+	gap = min(b - a for a, b in zip(starts, starts[1:]))
+	results.append(check('busy', _Stub.most_in_flight <= HOST_WORKERS and gap >= 0.9 / HOST_RATE,
+		'at most %d in flight, starts at least %.3fs apart' % (_Stub.most_in_flight, gap)))
+
+	return all(results)
+
+if __name__ == '__main__':
+	server = _Server(('127.0.0.1', 0), _Stub)
+	t = threading.Thread(target=server.serve_forever)
+	t.daemon = True
+	t.start()
+	try:
+		ok = run('http://127.0.0.1:' + str(server.server_address[1]) + '/')
+	finally:
+		server.shutdown()
+	sys.exit(0 if ok else 1)
@@ -4,21 +4,134 @@ import libxml2
 import pyexiv2
 import os
 import hashlib
+import struct
 from datetime import datetime
 from argparse import ArgumentParser
+from multiprocessing.pool import ThreadPool
 
 DEBUG = False # dumps data with labels to stdout.
 
-def _hashfile(afile, hasher, blocksize=65536):
-	buf = afile.read(blocksize)
-	while len(buf) > 0:
-		hasher.update(buf)
-		buf = afile.read(blocksize)
-	return hasher.hexdigest()
+BLOCKSIZE = 1048576 # large reads; these are often on SMB mounts
+
+class _Probe(object):
+	"""
+	Everything we need from a file, in one read: SHA-1, size, and for TIFFs 
+	and JP2s the pixel dimensions and MIME type (from the headers). Fed the 
+	file a block at a time. TIFF directories usually come after the image 
+	data, so we note where the first one is from the header and keep those
+	bytes when the read gets there.
+	"""
+	HEAD = 4096 # enough for the TIFF header, or a JP2's boxes up to ihdr
+	TIFF_IFD_WINDOW = 4096 # the entry count and plenty of 12 byte entries
+
+	def __init__(self):
+		self.hasher = hashlib.sha1()
+		self.checksum = None
+		self.size = 0
+		self.mimetype = None
+		self.width = None
+		self.height = None
+		self._head = ''
+		self._tiff_endian = None
+		self._ifd_start = None
+		self._ifd = ''
+
+	def update(self, buf):
+		offset = self.size
+		self.hasher.update(buf)
+		self.size += len(buf)
+		if self._head is not None:
+			self._head = self._head + buf[:self.HEAD - len(self._head)]
+			if len(self._head) == self.HEAD:
+				self._header()
+		if self._ifd_start is not None:
+			self._keep_ifd(buf, offset)
+
+	def _keep_ifd(self, buf, offset):
+		start = self._ifd_start + len(self._ifd) # the next byte we want
+		end = min(self._ifd_start + self.TIFF_IFD_WINDOW, offset + len(buf))
+		if offset <= start < end:
+			self._ifd = self._ifd + buf[start - offset:end - offset]
+
+	def _header(self):
+		head = self._head
+		self._head = None
+		if head[:4] in ('II*\x00', 'MM\x00*') and len(head) >= 8:
+			self._tiff_endian = '<' if head[:2] == 'II' else '>'
+			self._ifd_start = struct.unpack(self._tiff_endian + 'I', head[4:8])[0]
+			self._keep_ifd(head, 0)
+		elif head[4:8] == 'jP  ':
+			ihdr = head.find('ihdr')
+			if ihdr != -1 and len(head) >= ihdr + 12:
+				self.height, self.width = struct.unpack('>II', head[ihdr + 4:ihdr + 12])
+				self.mimetype = 'image/jp2'
+
+	def _tiff_dimensions(self):
+		e = self._tiff_endian
+		if len(self._ifd) < 2: return
+		count = struct.unpack(e + 'H', self._ifd[:2])[0]
+		for i in range(count):
+			entry = self._ifd[2 + i * 12:14 + i * 12]
+			if len(entry) < 12: break
+			tag, typ = struct.unpack(e + 'HH', entry[:4])
+			if typ == 3: value = struct.unpack(e + 'H', entry[8:10])[0] # SHORT
+			elif typ == 4: value = struct.unpack(e + 'I', entry[8:12])[0] # LONG
+			else: continue
+			if tag == 256: self.width = value
+			elif tag == 257: self.height = value
+		if self.width is not None and self.height is not None:
+			self.mimetype = 'image/tiff'
+
+	def finish(self):
+		if self._head is not None: # a small file
+			self._header()
+		if self._ifd_start is not None:
+			self._tiff_dimensions()
+		return self.hasher.hexdigest()
+
+def probe(path, blocksize=BLOCKSIZE):
+	"""
+	Read the file at path once; return a _Probe with its checksum, size and 
+	(for TIFFs and JP2s) dimensions and MIME type.
+	"""
+	p = _Probe()
+	f = open(path, 'rb')
+	try:
+		buf = f.read(blocksize)
+		while len(buf) > 0:
+			p.update(buf)
+			buf = f.read(blocksize)
+	finally:
+		f.close()
+	p.checksum = p.finish()
+	return p
 
 def currentDateTime():
 	return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ%z")
 
+def describeFile(path):
+	"""
+	Return a dict of the checksum (SHA-1), size, mimetype, width and height 
+	(None for PDFs) of the file at path, from one read of it.
+	"""
+	p = probe(path)
+	info = {'checksum': p.checksum, 'size': p.size, 'mimetype': p.mimetype,
+		'width': p.width, 'height': p.height}
+
+	if path.endswith(".pdf"):
+		info['mimetype'] = "application/pdf"
+		info['width'] = info['height'] = None
+	elif p.mimetype is None:
+		# not a header we know how to read; ask exiv2
+		metadata = pyexiv2.ImageMetadata(path)
+		metadata.read()
+
+		info['width'] = metadata.dimensions[0]
+		info['height'] = metadata.dimensions[1]
+		info['mimetype'] = metadata.mime_type
+
+	return info
+
 class Representation(object):
 	"""
 	The objid is in the path, we use it to help us spilt the path into 
@@ -39,10 +152,15 @@ class Representation(object):
 	Also takes care of checksums, calcuation of file size, 
 	mime-type, dimensions, rights, use, etc.
 	"""
-	def __init__(self, objid, path):
+	def __init__(self, objid, path, known=None, verify=False):
 
 		self.path = path
 
+		# checksum, size, etc. recorded when the file was made (see describeFile),
+		# so that we don't have to read it again unless asked to verify it
+		self._known = known
+		self._verify = verify
+
 		_tokens = path.split("/" + objid)
 		_local = _tokens[0]
 		_file_name = _tokens[1]
@@ -82,22 +200,21 @@ class Representation(object):
 		#urn
 		self.urn = "urn:pudl:images:" + self.use + ":" + self.cannonical
 
-		#checksum
-		self.checksum = _hashfile(file(self.path, "r"), hashlib.sha1())
-
-		# size
-		self.size = str(os.stat(self.path).st_size)
+		#checksum, size, mime, width, height
+		if self._known is not None and not self._verify:
+			info = self._known
+		else:
+			info = describeFile(self.path)
+			if self._known is not None:
+				for k in ('checksum', 'size'):
+					if str(self._known[k]) != str(info[k]):
+						raise ValueError(self.path + ' has changed since it was made (' + k + ')')
 
-		if not self.path.endswith(".pdf"):
-			#mime, width, height			
-			metadata = pyexiv2.ImageMetadata(self.path)
-			metadata.read()
-
-			self.width = str(metadata.dimensions[0])
-			self.height = str(metadata.dimensions[1])
-			self.mimetype = metadata.mime_type
-			
-		if self.path.endswith(".pdf"): self.mimetype = "application/pdf"
+		self.checksum = info['checksum']
+		self.size = str(info['size'])
+		self.mimetype = info['mimetype']
+		if info['width'] is not None: self.width = str(info['width'])
+		if info['height'] is not None: self.height = str(info['height'])
 
 		if DEBUG == True:
 			os.sys.stdout.write("USE: " + self.use + os.linesep)
@@ -142,29 +259,37 @@ class Representation(object):
 
 		return representationE
 
-if __name__ == "__main__":
-	parser = ArgumentParser()
-	parser.add_argument("--output", required=True, dest="out_name")
-	parser.add_argument("--input", required=True, dest="input_nodes", action="append")
-	parser.add_argument("--objid", required=True, dest="objid")
-	parser.add_argument("--docid", required=True, dest="docid")
-	
-	args = parser.parse_args()
-	docid = args.docid
-	out_name = args.out_name
-	objid = args.objid
-	input_nodes = args.input_nodes
-	
-	# First create a list of Representation objects. These basically encapsulate
-	# any path hacking and data extraction / calculation we have to do
-	representations = []
+def buildFolder(objid, docid, input_nodes, workers=1, known=None, verify=False):
+	"""
+	Return a libxml2 doc of very simple folder XML (that can be turned into
+	METS or anything else) describing the files at input_nodes (files, or 
+	directories of files). Files are read workers at a time, except for those
+	in known (a dict of normalized path -> describeFile() dict), which aren't
+	read at all unless verify is True. The caller is responsible for freeing it.
+	"""
+	if known is None: known = {}
+	def represent(path):
+		return Representation(objid, path, known.get(os.path.normpath(path)), verify)
+
+	paths = []
 	for node in input_nodes:
 		if os.path.isfile(node):
-			representations.append(Representation(objid, node))
+			paths.append(node)
 		else: # isdir
 			for f in os.listdir(node):
-				path = node + os.sep + f
-				representations.append(Representation(objid, path))
+				paths.append(node + os.sep + f)
+
+	# First create a list of Representation objects. These basically encapsulate
+	# any path hacking and data extraction / calculation we have to do
+	if workers > 1:
+		pool = ThreadPool(workers)
+		try:
+			representations = pool.map(represent, paths)
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		representations = [represent(path) for path in paths]
 	
 	
 	# Now create a dict that uses the 'abstract pathnames' 
@@ -201,7 +326,30 @@ if __name__ == "__main__":
 				memberE.setProp("abs_name", k)
 				memberE.addChild(rep.toElement())				
 
-	doc.saveFormatFileEnc(out_name, "UTF-8", 1)
+	return doc
+
+def folderXml(objid, docid, input_nodes, workers=1, known=None, verify=False):
+	"""
+	buildFolder, serialized (UTF-8, indented) to a string.
+	"""
+	doc = buildFolder(objid, docid, input_nodes, workers, known, verify)
+	try:
+		return doc.serialize("UTF-8", 1)
+	finally:
+		doc.freeDoc()
+
+if __name__ == "__main__":
+	parser = ArgumentParser()
+	parser.add_argument("--output", required=True, dest="out_name")
+	parser.add_argument("--input", required=True, dest="input_nodes", action="append")
+	parser.add_argument("--objid", required=True, dest="objid")
+	parser.add_argument("--docid", required=True, dest="docid")
+	parser.add_argument("--workers", type=int, default=1, dest="workers")
+	
+	args = parser.parse_args()
+
+	doc = buildFolder(args.objid, args.docid, args.input_nodes, args.workers)
+	doc.saveFormatFileEnc(args.out_name, "UTF-8", 1)
 	doc.freeDoc()
 	
 	os.sys.exit(0)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# HTTP GETs for main.py that don't hang and don't give up at the first hiccup:
+# connect and read timeouts, retries with (jittered, exponential) backoff for
+# 5xx responses, 429s and connection errors, and for each host a limit on how
+# many requests are in flight at once and how many are started per second, so
+# that the download pool can be large without leaning on any one server.
+#
+#===============================================================================
+
+from urlparse import urlparse
+import random
+import requests
+import threading
+import time
+
+# worth another try
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+	requests.exceptions.ChunkedEncodingError)
+
+class _Host(object):
+	"""
+	The concurrency and rate limits for one host.
+	"""
+	def __init__(self, workers, rate):
+		self.slots = threading.BoundedSemaphore(workers)
+		self.interval = 0.0
+		if rate > 0: self.interval = 1.0 / rate
+		self.lock = threading.Lock()
+		self.next_start = 0.0
+
+	def wait_turn(self, sleep=time.sleep, clock=time.time):
+		"""
+		Block until a request may be started, and claim that start.
+		"""
+		self.lock.acquire()
+		try:
+			now = clock()
+			start = max(now, self.next_start)
+			self.next_start = start + self.interval
+		finally:
+			self.lock.release()
+		if start > now: sleep(start - now)
+
+class Fetcher(object):
+	"""
+	GETs over a requests Session, with timeouts, retries and per-host limits.
+	Safe to use from any number of threads.
+	"""
+	def __init__(self, session, connect_timeout=10, read_timeout=60, retries=4,
+			backoff=1.0, max_backoff=60.0, host_workers=4, host_rate=0):
+		self.session = session
+		self.timeout = (connect_timeout, read_timeout)
+		self.retries = retries
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+		self.host_workers = host_workers
+		self.host_rate = host_rate
+		self.hosts = {}
+		self.lock = threading.Lock()
+		self.sleep = time.sleep
+
+	def _host(self, url):
+		name = urlparse(url).netloc.lower()
+		self.lock.acquire()
+		try:
+			if name not in self.hosts:
+				self.hosts[name] = _Host(self.host_workers, self.host_rate)
+			return self.hosts[name]
+		finally:
+			self.lock.release()
+
+	def delay(self, attempt, resp=None):
+		"""
+		Seconds to wait before retry number attempt (from 1): anywhere up to
+		backoff * 2^(attempt - 1), capped at max_backoff, or what a 429 or 503
+		asked for in Retry-After.
+		"""
+		if resp is not None:
+			retry_after = resp.headers.get('Retry-After')
+			if retry_after is not None and retry_after.strip().isdigit():
+				return min(float(retry_after), self.max_backoff)
+		return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** (attempt - 1))))
+
+	def fetch(self, url, handle, headers=None, log=None):
+		"""
+		GET url (streamed) and return handle(response). handle, which should
+		read the body if it wants it, is retried along with the request if the
+		connection fails part way through. If every try gets a 5xx (or 429),
+		handle gets the last one; if every try fails to connect or read, the
+		last error is raised. log, if given, is told about each retry.
+		"""
+		host = self._host(url)
+		host.slots.acquire()
+		try:
+			attempt = 0
+			while True:
+				host.wait_turn(self.sleep)
+				resp = None
+				try:
+					resp = self.session.get(url, stream=True, headers=headers, timeout=self.timeout)
+					if resp.status_code not in RETRY_STATUSES or attempt >= self.retries:
+						return handle(resp)
+					reason = 'HTTP ' + str(resp.status_code)
+				except RETRY_ERRORS, e:
+					if attempt >= self.retries: raise
+					reason = e.__class__.__name__ + ': ' + str(e)
+				finally:
+					if resp is not None: resp.close()
+				attempt += 1
+				wait = self.delay(attempt, resp)
+				if log is not None:
+					log.warn(url + ' failed (' + reason + '); try ' + str(attempt + 1) + ' of ' +
+						str(self.retries + 1) + ' in %.1fs' % wait)
+				self.sleep(wait)
+		finally:
+			host.slots.release()
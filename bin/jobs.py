@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# Where main.py keeps track of the Pdfs for an EAD while it works on them: an
+# SQLite database in the run's scratch dir with one row per Pdf (its
+# attributes, as JSON, so that ints stay ints and None stays None) and one row
+# per Pdf per stage (status and timing). Every update is its own transaction,
+# so a crash loses at most the stage that was in progress.
+#
+#===============================================================================
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pdfs (
+	src_url TEXT PRIMARY KEY,
+	seq INTEGER NOT NULL,
+	record TEXT NOT NULL,
+	updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stages (
+	src_url TEXT NOT NULL,
+	stage TEXT NOT NULL,
+	status TEXT NOT NULL, -- running, done or failed
+	started REAL,
+	finished REAL,
+	error TEXT,
+	PRIMARY KEY (src_url, stage)
+);
+"""
+
+def _utf8(obj):
+	"""
+	json gives us unicode; the rest of the code deals in UTF-8 strs.
+	"""
+	if isinstance(obj, unicode):
+		return obj.encode('utf-8')
+	elif isinstance(obj, dict):
+		return dict((_utf8(k), _utf8(v)) for k, v in obj.items())
+	elif isinstance(obj, list):
+		return [_utf8(v) for v in obj]
+	elif isinstance(obj, tuple):
+		return tuple(_utf8(v) for v in obj)
+	return obj
+
+class JobStore(object):
+	"""
+	The Pdfs (and their progress through the stages) for one run. Safe to use
+	from any number of threads.
+	"""
+	def __init__(self, path):
+		dir = os.path.dirname(path)
+		if not os.path.exists(dir):
+			os.makedirs(dir, 0755)
+		self.path = path
+		self.conn = sqlite3.connect(path, check_same_thread=False)
+		self.conn.executescript(_SCHEMA)
+		self.lock = threading.Lock()
+
+	def _record(self, pdf_obj):
+		return json.dumps(pdf_obj.__dict__, sort_keys=True)
+
+	def save_all(self, pdf_objs):
+		"""
+		Save (or replace) every Pdf, remembering their order.
+		"""
+		self.lock.acquire()
+		try:
+			with self.conn:
+				now = time.time()
+				for seq, pdf_obj in enumerate(pdf_objs):
+					self.conn.execute("INSERT OR REPLACE INTO pdfs VALUES (?, ?, ?, ?)",
+						(pdf_obj.src_url, seq, self._record(pdf_obj), now))
+		finally:
+			self.lock.release()
+
+	def start_stage(self, pdf_obj, stage):
+		"""
+		Note that a Pdf has started a stage. Returns the start time.
+		"""
+		started = time.time()
+		self.lock.acquire()
+		try:
+			with self.conn:
+				self.conn.execute("INSERT OR REPLACE INTO stages VALUES (?, ?, 'running', ?, NULL, NULL)",
+					(pdf_obj.src_url, stage, started))
+		finally:
+			self.lock.release()
+		return started
+
+	def finish_stage(self, pdf_obj, stage, error=None):
+		"""
+		Save a Pdf and note that it has finished a stage (it failed if there's
+		an error), in one transaction.
+		"""
+		status = 'done' if error is None else 'failed'
+		self.lock.acquire()
+		try:
+			with self.conn:
+				now = time.time()
+				self.conn.execute("UPDATE pdfs SET record = ?, updated = ? WHERE src_url = ?",
+					(self._record(pdf_obj), now, pdf_obj.src_url))
+				self.conn.execute("UPDATE stages SET status = ?, finished = ?, error = ? WHERE src_url = ? AND stage = ?",
+					(status, now, error, pdf_obj.src_url, stage))
+		finally:
+			self.lock.release()
+
+	def clear(self):
+		"""
+		Forget everything; we're starting over.
+		"""
+		self.lock.acquire()
+		try:
+			with self.conn:
+				self.conn.execute("DELETE FROM pdfs")
+				self.conn.execute("DELETE FROM stages")
+		finally:
+			self.lock.release()
+
+	def is_done(self, pdf_obj, stage):
+		"""
+		True if a Pdf has finished a stage (without error).
+		"""
+		self.lock.acquire()
+		try:
+			row = self.conn.execute("SELECT status FROM stages WHERE src_url = ? AND stage = ?",
+				(pdf_obj.src_url, stage)).fetchone()
+		finally:
+			self.lock.release()
+		return row is not None and row[0] == 'done'
+
+	def failures(self):
+		"""
+		The number of stages that failed (or never finished), over all Pdfs.
+		"""
+		self.lock.acquire()
+		try:
+			row = self.conn.execute("SELECT COUNT(*) FROM stages WHERE status != 'done'").fetchone()
+		finally:
+			self.lock.release()
+		return row[0]
+
+	def load(self, cls):
+		"""
+		Return the saved Pdfs, in order, as instances of cls.
+		"""
+		self.lock.acquire()
+		try:
+			rows = self.conn.execute("SELECT record FROM pdfs ORDER BY seq").fetchall()
+		finally:
+			self.lock.release()
+		pdf_objs = []
+		for (record,) in rows:
+			pdf_obj = cls()
+			pdf_obj.__dict__.update(_utf8(json.loads(record)))
+			pdf_objs.append(pdf_obj)
+		return pdf_objs
+
+	def stages(self, pdf_obj):
+		"""
+		Return a dict of stage -> (status, started, finished, error) for a Pdf.
+		"""
+		self.lock.acquire()
+		try:
+			rows = self.conn.execute("SELECT stage, status, started, finished, error FROM stages WHERE src_url = ?",
+				(pdf_obj.src_url,)).fetchall()
+		finally:
+			self.lock.release()
+		return dict((_utf8(r[0]), _utf8(tuple(r[1:]))) for r in rows)
+
+	def close(self):
+		self.conn.close()
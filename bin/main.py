@@ -16,6 +16,7 @@
 #  * libxml2 (and python bindings; generally on ubuntu systems)
 #  * requests http://docs.python-requests.org/en/latest/index.html (pip install requests)
 #  * ocrad (apt-get install ocrad)
+#  * aspell (apt-get install aspell)
 #  * convert (apt-get install imagemagick)
 #  * pdfimages (apt-get install poppler-utils)
 #  * pyexiv2 (apt-get install  python-pyexiv2)
@@ -23,10 +24,26 @@
 #===============================================================================
 
 from PIL import Image
+from argparse import ArgumentParser
+from budget import MemoryBudget, physical_memory
+from cache import DownloadCache
+from dao import describeFile, folderXml
+from fetch import Fetcher
+from jobs import JobStore
+from Queue import Queue
+from StringIO import StringIO
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+from normalize import normalize_to_tiff, target_long_side
+from orient import LazySpeller, Speller, orientation
+from saxon import SaxonError, SaxonWorker
+from stats import Process, Stats, size_of
+from transfer import TransferError, move_dir, move_file
 from reportlab.pdfgen import pdfimages
+from requests.adapters import HTTPAdapter
 from string import zfill
-from sys import exit, argv
-from shutil import copy
+from sys import exit
+from shutil import copymode, rmtree
 import ConfigParser
 import hashlib
 import libxml2
@@ -36,6 +53,17 @@ import os
 import requests
 import subprocess
 import re
+import tempfile
+import threading
+import time
+
+_PDFIMAGES_NAME = re.compile(r'-(\d+)\.p[bgp]m$')
+
+class StageError(Exception):
+	"""
+	A stage could not be completed for a Pdf.
+	"""
+	pass
 
 def normalize_whitespace(str):
 	str = str.strip()
@@ -59,204 +87,390 @@ class Pdf():
 		self.jp2s_dir = None
 		self.mets_path = None
 		self.mets_uri = None
+		self.files = {} # normalized path -> checksum, size, etc. of files we've made (see dao.describeFile)
 		
 	def __str__(self):
-		keys = self.__dict__.keys()
-		keys.sort()
-		props = []
-		for k in keys:
-			props.append(str(self.__dict__.get(k)))
-		return '%%'.join(props)
-	
-	@staticmethod
-	def slurp(path):
-		"""
-		Given a text file (incl. a header row) of Pdf object properties, return
-		a list of Pdf objects.
-		"""
-		pdfs = []
-		try:
-			report = open(path, 'r')
-			properties_hdr = []
-			c = 0
-			for line in report:
-				line = line.strip()
-				if c == 0: 
-					properties_hdr = [prop for prop in line.split('%%')]
-				else:
-					d = 0
-					pdf = Pdf()
-					for prop in line.split('%%'):
-						pdf.__dict__[properties_hdr[d]] = prop
-						d += 1
-					pdfs.append(pdf)
-				c += 1
-		finally:			
-			report.close()
-		
-		return pdfs
+		# for logging; the job store keeps the Pdf itself (see jobs.py)
+		return 'Pdf ' + str(self.host_c_id) + ' (' + str(self.src_url) + ', HTTP ' + str(self.pdf_resp_status) + ')'
 
-	
-	@staticmethod
-	def serialize(path, pdfs):
-		"""
-		Given a list Pdf objects, serialize them to the file at the path parameter.
-		"""
-		dir = os.path.dirname(path)
-		if not os.path.exists(dir):
-			os.makedirs(dir, 0755)
-			logr.debug("made: " + dir)
-			
-		report_file = open(path, 'w')
+class Dao():
+	"""
+	What we need to know about a dao, gathered in one pass over the EAD by 
+	index_daos (or, without the node, scan_daos).
+	"""
+	def __init__(self, node, href):
+		self.node = node
+		self.href = href
+		self.unittitle = None # content of the first sibling ead:unittitle
+		self.unitdate = None # content of the first sibling ead:unitdate
+		self.pdf_idx = 0 # number of preceding sibling daos that link to pdfs
+		self.host_c_id = None
+
+def _is_ead_element(node, name):
+	if node.type != 'element' or node.name != name:
+		return False
+	ns = node.ns()
+	return ns is not None and ns.content == _EAD_NS
+
+def index_daos(doc):
+	"""
+	Walk the EAD once and return a dict of @xlink:href -> Dao. Where an href 
+	is used more than once, the first dao in document order wins, just as it
+	did with the "//ead:dao[@xlink:href=...]" queries this replaces.
+	"""
+	index = {}
+	stack = [doc.getRootElement()]
+	while stack:
+		parent = stack.pop()
+		children = []
+		unittitle = None
+		unitdate = None
+		pdf_count = 0
+		daos = []
+
+		child = parent.children
+		while child is not None:
+			if child.type == 'element':
+				children.append(child)
+				if _is_ead_element(child, 'dao'):
+					href = child.nsProp('href', _XLINK_NS)
+					if href is not None:
+						daos.append((child, href, pdf_count))
+						if '.pdf' in href: pdf_count += 1
+				elif _is_ead_element(child, 'unittitle') and unittitle is None:
+					unittitle = child.content
+				elif _is_ead_element(child, 'unitdate') and unitdate is None:
+					unitdate = child.content
+			child = child.next
+
+		host = parent.parent
+		for (node, href, pdf_idx) in daos:
+			if href in index: continue
+			dao = Dao(node, href)
+			if _is_ead_element(parent, 'did'):
+				dao.unittitle = unittitle
+				dao.unitdate = unitdate
+			dao.pdf_idx = pdf_idx
+			if host is not None and host.type == 'element':
+				dao.host_c_id = host.prop('id')
+			index[href] = dao
+
+		# keep document order
+		children.reverse()
+		stack.extend(children)
+
+	return index
+
+# the pre-check reads this much of an EAD at a time
+_PRECHECK_BLOCK = 1048576
+
+def may_have_pdfs(ead_path):
+	"""
+	False if the EAD at ead_path can't have a dao for a PDF: it doesn't contain
+	".pdf" anywhere. Much cheaper than parsing it.
+	"""
+	f = open(ead_path, 'rb')
+	try:
+		tail = ''
+		buf = f.read(_PRECHECK_BLOCK)
+		while len(buf) > 0:
+			if '.pdf' in tail + buf:
+				return True
+			tail = buf[-3:] # in case it straddles two blocks
+			buf = f.read(_PRECHECK_BLOCK)
+	finally:
+		f.close()
+	return False
+
+class _Frame():
+	"""
+	An open element, while scan_daos is inside it.
+	"""
+	def __init__(self, reader):
+		self.is_did = reader.LocalName() == 'did' and reader.NamespaceUri() == _EAD_NS
+		self.id = reader.GetAttribute('id')
+		self.unittitle = None
+		self.unitdate = None
+		self.pdf_count = 0
+		self.daos = [] # (seq, Dao or None if it has no href, show, role)
+
+def scan_daos(ead_path):
+	"""
+	Find the daos for (new) PDFs in the EAD at ead_path, in one forward pass 
+	with a pull parser, so that only the elements we're inside of (and their 
+	daos) are ever in memory. Returns a list of Dao (without nodes) in document
+	order, chosen and filled in exactly as get_pdfs does from the whole DOM.
+	"""
+	reader = libxml2.newTextReaderFilename(ead_path)
+	if reader is None:
+		raise IOError('could not read ' + ead_path)
+
+	stack = []
+	first = {} # href -> (seq, Dao): the first dao with an href wins, as in index_daos
+	candidates = [] # (seq, href)
+	seq = 0
+
+	def close(frame):
+		host_c_id = None
+		if stack: host_c_id = stack[-1].id
+		for i, (n, dao, show, role) in enumerate(frame.daos):
+			if dao is None: # no href; only its role matters, to the daos before it
+				continue
+			if frame.is_did:
+				dao.unittitle = frame.unittitle
+				dao.unitdate = frame.unitdate
+			dao.host_c_id = host_c_id
+			if dao.href not in first or first[dao.href][0] > n:
+				first[dao.href] = (n, dao)
+			# the same tests as get_pdfs' XPath
+			if ('.pdf' in dao.href and '/Accessions/' not in dao.href and show != 'none'
+					and not [d for d in frame.daos[i + 1:] if d[3] == _METS_ROLE]):
+				candidates.append((n, dao.href))
+
+	ret = reader.Read()
+	while ret == 1:
+		node_type = reader.NodeType()
+		if node_type == 1: # element
+			parent = None
+			if stack: parent = stack[-1]
+			ead = reader.NamespaceUri() == _EAD_NS
+			name = reader.LocalName()
+			if ead and name == 'dao' and parent is not None:
+				href = reader.GetAttributeNs('href', _XLINK_NS)
+				dao = None
+				if href is not None:
+					dao = Dao(None, href)
+					dao.pdf_idx = parent.pdf_count
+					if '.pdf' in href: parent.pdf_count += 1
+				# kept with or without an href: a METS role tells on the daos 
+				# before it
+				parent.daos.append((seq, dao, reader.GetAttributeNs('show', _XLINK_NS), 
+					reader.GetAttributeNs('role', _XLINK_NS)))
+				seq += 1
+			elif ead and name in ('unittitle', 'unitdate') and parent is not None and parent.is_did:
+				if getattr(parent, name) is None:
+					setattr(parent, name, reader.Expand().content)
+			if not reader.IsEmptyElement():
+				stack.append(_Frame(reader))
+		elif node_type == 15: # end of element
+			frame = stack.pop()
+			close(frame)
+		ret = reader.Read()
+	if ret != 0:
+		raise IOError('could not parse ' + ead_path)
+
+	candidates.sort()
+	return [first[href][1] for n, href in candidates]
+
+def get_pdfs(ead_path, download=True, doc=None):
+	"""
+	Find the daos for (new) PDFs in an EAD and return a list of Pdf objects.
+	Unless download is False, the PDFs are downloaded too. If doc (the parsed
+	EAD) is given it is used, and left for the caller to free; otherwise the
+	EAD is scanned with scan_daos if STREAM_SCAN is set, and parsed if not.
+	"""
+	if doc is None and STREAM_SCAN:
+		daos = scan_daos(ead_path)
+	else:
+		daos = find_daos(ead_path, doc)
+
+	pdf_objs = []
+	for dao in daos:
+		# initialize a Pdf object
+		logr.debug("---------------------------------------------------------------------------")
+		pdf_obj = Pdf()
+		pdf_obj.src_url = str(dao.href)
+		logr.debug("src_url: " + pdf_obj.src_url)
+
+		title = (dao.unittitle or '') + ', ' + (dao.unitdate or '')
+		title = title.replace('"', '&quot;').replace("'", '&apos;')
+		pdf_obj.pdf_title = normalize_whitespace(title)
+		logr.debug('pdf_obj.pdf_title: ' + pdf_obj.pdf_title)
+
+		# if we have preceding daos for pdfs we need to add an index number onto the file name
+		pdf_obj.pdf_idx = dao.pdf_idx
 		
-		# header
-		keys = pdfs[0].__dict__.keys()
-		keys.sort()
-		report_file.write("%%".join(keys) + '\n')
+		# get the ID of the host component id			
+		pdf_obj.host_c_id = dao.host_c_id
+		logr.debug("host_c_id: " + pdf_obj.host_c_id)			
 		
-		for pdf_obj in pdfs:
-			report_file.write(pdf_obj.__str__() + '\n')
-		report_file.close()
+		# add the object to the list; downloads happen below, in parallel
+		pdf_objs.append(pdf_obj)
+
+	if pdf_objs == []:
+		logr.info("No (new) PDFs found in " + ead_path + ".")
+	elif download:
+		download_pdfs(pdf_objs)
 
-def get_pdfs(ead_path):
+	return pdf_objs
+
+def find_daos(ead_path, doc=None):
+	"""
+	Find the daos for (new) PDFs in an EAD, from the whole DOM (doc, if given;
+	the caller frees it). Returns a list of Dao in document order.
+	"""
+	own_doc = doc is None
+	if own_doc: doc = libxml2.parseFile(ead_path)
 	try:
-		doc = libxml2.parseFile(ead_path)
 		ctxt = doc.xpathNewContext()
 		ctxt.xpathRegisterNs('xlink', _XLINK_NS)
 		ctxt.xpathRegisterNs('ead', _EAD_NS)
 		
-		eadid = ctxt.xpathEval("//ead:eadid")[0].content
-		
-		pdf_objs = []
-		
-		#TODO: test this - skipping daos that don't have a METS following
+		# skipping daos that have a METS following
 		daos = ctxt.xpathEval("""
 			//ead:dao[
 				contains(@xlink:href, '.pdf')
 				and not(contains(@xlink:href, '/Accessions/'))
 				and not(@xlink:show='none') 
-				and not(./following-sibling::ead:dao[@xlink:role='" + _METS_NS + "'])
+				and not(./following-sibling::ead:dao[@xlink:role='""" + _METS_ROLE + """'])
 			]
 			""")
+		found = []
 		if daos != []:
+			dao_index = index_daos(doc)
 			for pdf_dao in daos:
-				# initialize a Pdf object
-				logr.debug("---------------------------------------------------------------------------")
-				pdf_obj = Pdf()
-				pdf_obj.src_url = str(pdf_dao.nsProp("href", _XLINK_NS))
-				logr.debug("src_url: " + pdf_obj.src_url)
-	
-				title_xpath = "//ead:did[ead:dao[@xlink:href='" + pdf_obj.src_url + "']]/ead:unittitle[1]"
-				date_xpath = "//ead:did[ead:dao[@xlink:href='" + pdf_obj.src_url + "']]/ead:unitdate[1]"
-				title_date_xpath = "concat(" + title_xpath + ", ', ', " + date_xpath + ")"
-				
-				logr.debug('title_date_xpath: ' + title_date_xpath)
-				
-				title = ctxt.xpathEval(title_date_xpath)
-				title = title.replace('"', '&quot;').replace("'", '&apos;')
-				pdf_obj.pdf_title = normalize_whitespace(title)
-				logr.debug('pdf_obj.pdf_title: ' + pdf_obj.pdf_title)
-	
-				# check if we have preceding daos for pdfs, in which case we need to add an index number onto the file name below
-				idx_xpath = "count(//ead:dao[@xlink:href='"
-				idx_xpath = idx_xpath + pdf_obj.src_url
-				idx_xpath = idx_xpath + "']/preceding-sibling::ead:dao[contains(@xlink:href, '.pdf')])"
-	
-				pdf_obj.pdf_idx = int(ctxt.xpathEval(idx_xpath))
-				
-				# get the ID of the host component id			
-				pdf_obj.host_c_id = pdf_dao.parent.parent.prop('id') 			
-				logr.debug("host_c_id: " + pdf_obj.host_c_id)			
-				
-				# try to download the PDF
-				req = requests.get(pdf_obj.src_url) 
-				pdf_obj.pdf_resp_status = req.status_code
-				logr.debug("pdf_resp_status: " + str(pdf_obj.pdf_resp_status))
-				
-				if pdf_obj.pdf_resp_status == 200:
-					
-					# e.g. MC216_c003 -> $PDFS_LOCAL_ROOT/MC216/c003[.idx].pdf
-					pdf_obj.pdf_local_path = os.path.join(PDFS_LOCAL_ROOT, pdf_obj.host_c_id.replace('_', '/'))
-					if pdf_obj.pdf_idx > 0: pdf_obj.pdf_local_path = pdf_obj.pdf_local_path + '_' + str(pdf_obj.pdf_idx)
-					pdf_obj.pdf_local_path = pdf_obj.pdf_local_path + ".pdf"
-					logr.debug('pdf_local_path: ' + pdf_obj.pdf_local_path)
-					
-					if not os.path.exists(pdf_obj.pdf_local_path):
-						# make the storage dir
-						dir = os.path.dirname(pdf_obj.pdf_local_path)
-						if not os.path.exists(dir):
-							os.makedirs(dir, 0755)
-							logr.debug("made: " + dir)
-						
-						f = open(pdf_obj.pdf_local_path, 'w')
-						f.write(req.content)
-						f.close()
-	
-					else:
-						logr.warn("file: " + pdf_obj.pdf_local_path + " exists; no further action.")
-				
-				
-				# add the object to the list 
-				pdf_objs.append(pdf_obj)
-		else:
-			logr.info("No (new) PDFs found in " + eadid + ". Will exit.")
-			exit(0)
-			
+				found.append(dao_index[pdf_dao.nsProp("href", _XLINK_NS)])
 	finally:
 		ctxt.xpathFreeContext()
-		doc.freeDoc()
+		if own_doc: doc.freeDoc()
+
+	return found
+
+def download_pdfs(pdf_objs):
+	"""
+	Download the PDFs for a list of Pdf objects, DOWNLOAD_WORKERS at a time,
+	over a single keep-alive session.
+	"""
+	DOWNLOAD_POOL.map(lambda pdf_obj: download_pdf(FETCHER, pdf_obj), pdf_objs)
+
+def download_pdf(fetcher, pdf_obj):
+	"""
+	Download one PDF, streaming the body to disk in DOWNLOAD_CHUNK_SIZE chunks.
+	What we got is kept in the download cache (CACHE): a PDF we already have
+	is only asked about (a conditional GET), and a 401 or 404 is believed for
+	DEAD_TTL seconds without asking again. fetcher (a fetch.Fetcher) takes 
+	care of timeouts, retries and not overloading the server.
+	"""
+	cached = CACHE.get(pdf_obj.src_url)
+	if cached is not None and cached.status in (401, 404) and time.time() - cached.checked < DEAD_TTL:
+		pdf_obj.pdf_resp_status = cached.status
+		logr.info(pdf_obj.src_url + ' returned a ' + str(cached.status) + ' on ' + time.ctime(cached.checked) + '; not asking again yet')
+		return
+
+	# e.g. MC216_c003 -> $PDFS_LOCAL_ROOT/MC216/c003[.idx].pdf
+	local_path = os.path.join(PDFS_LOCAL_ROOT, pdf_obj.host_c_id.replace('_', '/'))
+	if pdf_obj.pdf_idx > 0: local_path = local_path + '_' + str(pdf_obj.pdf_idx)
+	local_path = local_path + ".pdf"
+
+	ours = cached is not None and cached.is_ours(local_path)
+	headers = {}
+	if ours: headers = cached.validators()
+
+	def handle(req):
+		pdf_obj.pdf_resp_status = req.status_code
+		logr.debug("pdf_resp_status for " + pdf_obj.src_url + ": " + str(pdf_obj.pdf_resp_status))
+
+		if pdf_obj.pdf_resp_status == 304 and ours:
+			# unchanged; the copy we have will do
+			pdf_obj.pdf_resp_status = 200
+			pdf_obj.pdf_local_path = local_path
+			pdf_obj.files[os.path.normpath(local_path)] = {'checksum': cached.checksum, 
+				'size': cached.size, 'mimetype': 'application/pdf', 'width': None, 'height': None}
+			CACHE.touch(pdf_obj.src_url)
+			logr.info("not modified: " + pdf_obj.src_url + "; using " + local_path)
+
+		elif pdf_obj.pdf_resp_status == 200:
+			pdf_obj.pdf_local_path = local_path
+			logr.debug('pdf_local_path: ' + pdf_obj.pdf_local_path)
+
+			if ours:
+				logr.warn(pdf_obj.src_url + " has changed since we downloaded it; replacing " + local_path)
+
+			if ours or not os.path.exists(pdf_obj.pdf_local_path):
+				# make the storage dir
+				dir = os.path.dirname(pdf_obj.pdf_local_path)
+				if not os.path.exists(dir):
+					try:
+						os.makedirs(dir, 0755)
+						logr.debug("made: " + dir)
+					except OSError:
+						if not os.path.isdir(dir): raise # another worker got there first
+
+				# write to a temp name so that an interrupted download isn't
+				# mistaken for a complete one on the next run
+				part_path = pdf_obj.pdf_local_path + '.part'
+				sha1 = hashlib.sha1()
+				size = 0
+				f = open(part_path, 'wb')
+				try:
+					for chunk in req.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+						f.write(chunk)
+						sha1.update(chunk)
+						size += len(chunk)
+				finally:
+					f.close()
+				os.rename(part_path, pdf_obj.pdf_local_path)
+				pdf_obj.files[os.path.normpath(pdf_obj.pdf_local_path)] = {'checksum': sha1.hexdigest(), 
+					'size': size, 'mimetype': 'application/pdf', 'width': None, 'height': None}
+				CACHE.put(pdf_obj.src_url, 200, req.headers.get('ETag'), req.headers.get('Last-Modified'),
+					size, sha1.hexdigest(), pdf_obj.pdf_local_path)
+				logr.debug("downloaded: " + pdf_obj.pdf_local_path)
+			else:
+				logr.warn("file: " + pdf_obj.pdf_local_path + " exists; no further action.")
+
+		elif pdf_obj.pdf_resp_status in (401, 404):
+			CACHE.put(pdf_obj.src_url, pdf_obj.pdf_resp_status)
+
+	fetcher.fetch(pdf_obj.src_url, handle, headers, logr)
 
-	return pdf_objs
-	
 def extract_bitmaps_from_pdf(pdf_obj):
 	"""
 	Extract bitmaps from a PDF.
 	"""
-	if int(pdf_obj.pdf_resp_status) == 200 and os.path.exists(pdf_obj.pdf_local_path):
+	if pdf_obj.pdf_resp_status == 200 and os.path.exists(pdf_obj.pdf_local_path):
 		
 		# figure out the path to the output dir
 		pdf_obj.bitmaps_dir = os.path.join(BITMAPS_ROOT, pdf_obj.host_c_id.replace('_', os.sep))
-		if int(pdf_obj.pdf_idx) > 0: 
-			pdf_obj.bitmaps_dir = pdf_obj.bitmaps_dir + '_' + pdf_obj.pdf_idx
+		if pdf_obj.pdf_idx > 0: 
+			pdf_obj.bitmaps_dir = pdf_obj.bitmaps_dir + '_' + str(pdf_obj.pdf_idx)
 		pdf_obj.bitmaps_dir = pdf_obj.bitmaps_dir + os.sep
 		logr.debug('bitmaps_dir for ' + pdf_obj.host_c_id + ": " + pdf_obj.bitmaps_dir)
 		
-		# make the output dir if necessary
-		if not os.path.exists(pdf_obj.bitmaps_dir):
-			os.makedirs(pdf_obj.bitmaps_dir, 0755)
-			logr.debug('made: ' + pdf_obj.bitmaps_dir)
-		else:
-			logr.debug('exists: ' + pdf_obj.bitmaps_dir)
+		# the dir only gets its real name once pdfimages has finished, so if it
+		# exists it's complete
+		if os.path.exists(pdf_obj.bitmaps_dir):
+			logr.info('already extracted: ' + pdf_obj.bitmaps_dir)
+			return
+
+		# start over if an earlier run was interrupted
+		part_dir = pdf_obj.bitmaps_dir[:-1] + '.part' + os.sep
+		if os.path.exists(part_dir):
+			rmtree(part_dir)
+			logr.warn('removed incomplete extraction: ' + part_dir)
+		os.makedirs(part_dir, 0755)
+		logr.debug('made: ' + part_dir)
+
+		# build the command
+		pdfimages_cmd = PDFIMAGES + " " + pdf_obj.pdf_local_path + " " + part_dir + 'x'
+		logr.debug('pdfimages_cmd: ' + pdfimages_cmd)
 		
-		# don't generate if the directory is not empty
-		if len(os.listdir(pdf_obj.bitmaps_dir)) > 0:
-			logr.error('not empty: ' + pdf_obj.bitmaps_dir)
-			logr.error('skipping ' + pdf_obj.pdf_local_path)
-		else:
-			# build the command
-			pdfimages_cmd = PDFIMAGES + " " + pdf_obj.pdf_local_path + " " + pdf_obj.bitmaps_dir + 'x'
-			logr.debug('pdfimages_cmd: ' + pdfimages_cmd)
-			
-			# execute 
-			pdfimgage_proc = subprocess.Popen(pdfimages_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-			exit_code = pdfimgage_proc.wait()
-			logr.debug('exit: ' + str(exit_code))
-			 
-			for line in pdfimgage_proc.stdout:
-				logr.debug(line.rstrip())
-				
-			for line in pdfimgage_proc.stderr:
-				logr.error(line.rstrip()) 
+		# execute 
+		exit_code = _run(pdfimages_cmd, pdf=_pdf_key(pdf_obj), stage='bitmaps', 
+			src=pdf_obj.pdf_local_path, dest=part_dir)
+		if exit_code != 0:
+			rmtree(part_dir)
+			raise StageError('pdfimages exited ' + str(exit_code) + ' for ' + pdf_obj.pdf_local_path)
+		os.rename(part_dir[:-1], pdf_obj.bitmaps_dir[:-1])
 	else:
 		logr.debug(pdf_obj.src_url + " was not downloaded and/or does not exist on the filesystem")
 
 def bitmaps_to_tiff(pdf_obj, rm_bitmaps=True):
 	
-	if int(pdf_obj.pdf_resp_status) == 200 and os.path.exists(pdf_obj.bitmaps_dir):
+	if pdf_obj.pdf_resp_status == 200 and os.path.exists(pdf_obj.bitmaps_dir):
 		# figure out the path to the output dir
 		pdf_obj.tiffs_dir = os.path.join(TIFFS_LOCAL_ROOT, pdf_obj.host_c_id.replace('_', os.sep))
-		if int(pdf_obj.pdf_idx) > 0: 
-			pdf_obj.tiffs_dir = pdf_obj.tiffs_dir + '_' + pdf_obj.pdf_idx
+		if pdf_obj.pdf_idx > 0: 
+			pdf_obj.tiffs_dir = pdf_obj.tiffs_dir + '_' + str(pdf_obj.pdf_idx)
 		pdf_obj.tiffs_dir = pdf_obj.tiffs_dir + os.sep
 		logr.debug('tiffs_dir for ' + pdf_obj.host_c_id + ": " + pdf_obj.tiffs_dir)
 		
@@ -265,72 +479,46 @@ def bitmaps_to_tiff(pdf_obj, rm_bitmaps=True):
 			os.makedirs(pdf_obj.tiffs_dir, 0755)
 			logr.debug('made: ' + pdf_obj.tiffs_dir)
 		 
-		c = 1
+		_remove_partials(pdf_obj.tiffs_dir)
+		_remove_partials(pdf_obj.bitmaps_dir) # half-saved rotations
+
+		jp2s_dir = None
+		if FUSED_JP2S: jp2s_dir = _make_jp2s_dir(pdf_obj)
+
 		files = os.listdir(pdf_obj.bitmaps_dir)
 		files.sort()
+		pages = []
+		c = 1
 		for bmp in files:
 			bmp = os.path.join(pdf_obj.bitmaps_dir, bmp)
-			file_ext = os.path.splitext(bmp)[1]
-			if file_ext == '.pbm':
-				pdf_obj.img_bits = 1
-			elif file_ext == '.pgm':
-				pdf_obj.img_bits = 8
-			else:
-				pdf_obj.img_bits = 24
-			
-			tiff_name = os.path.join(pdf_obj.tiffs_dir, str(c).zfill(8) + '.tif')
-			if not os.path.exists(tiff_name):
-				# rotate if text-based (generally bitonal or grayscale)
-				if pdf_obj.img_bits != 24:
-					rotate_cmd = _BIN + os.sep + 'orient_image.sh ' + bmp
-					logr.debug('rotate_cmd: ' + rotate_cmd)
-					# (build the command)	
-					rotate_proc = subprocess.Popen(rotate_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-					exit_code = rotate_proc.wait()
-					logr.debug('exit: ' + str(exit_code))
-					 
-					for line in rotate_proc.stdout:
-						logr.debug(line.rstrip())
-					for line in rotate_proc.stderr:
-						logr.error(line.rstrip()) 
-				
-				# convert
-				
-				# figure out the long dimension, we want a multiple of 100
-				img_file = open(bmp, 'r')
-				im = Image.open(img_file)
-				long_side = max(im.size)
-				rounded = int(round(long_side, -2))
-				if rounded > long_side: rounded = rounded - 100
-				resize = str(rounded) + 'x' + str(rounded) + '\>'
-				img_file.close()
-				
-				# (build the command)
-				convert_cmd = CONVERT + ' ' + bmp + ' -resize ' + resize + ' -quality 100 '
-				if pdf_obj.img_bits == 24: convert_cmd = convert_cmd + '-profile ' + SRGB_PROFILE + ' '
-				else: convert_cmd = convert_cmd + '-depth 8 -profile ' + GRAY_PROFILE + ' '
-				convert_cmd = convert_cmd + tiff_name
-				logr.debug('convert_cmd: ' + convert_cmd)
-				
-				convert_proc = subprocess.Popen(convert_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-				exit_code = convert_proc.wait()
-				logr.debug('exit: ' + str(exit_code))
-				
-				for line in convert_proc.stdout:
-					logr.debug(line.rstrip())
-				for line in convert_proc.stderr:
-					logr.error(line.rstrip())
-			
-				# delete the bitmap
-				if rm_bitmaps: 
-					os.remove(bmp)
-				else:
-					logr.warn("rm_bitmaps set to False. This is intended for debugging and will fill the disk quickly.")
-			
-			else:
-				logr.error(tiff_name + ' already exists, will not regenerate.')
-			
+			pdf_obj.img_bits = _bitmap_bits(bmp)
+			# numbered by pdfimages' own count, so that bitmaps removed by an 
+			# earlier (interrupted) run don't shift the pages that are left
+			name = str(_page_number(bmp, c)).zfill(8)
+			tiff_name = os.path.join(pdf_obj.tiffs_dir, name + '.tif')
+			jp2_name = None
+			if jp2s_dir is not None: jp2_name = os.path.join(jp2s_dir, name + '.jp2')
+			pages.append([bmp, tiff_name, rm_bitmaps, None, pdf_obj.files, _pdf_key(pdf_obj), jp2_name])
 			c += 1
+
+		# one aspell for all of this PDF's text-based pages
+		speller = None
+		if [p for p in pages if _bitmap_bits(p[0]) != 24]:
+			speller = Speller(ASPELL)
+			for p in pages: p[3] = speller
+
+		# convert the pages TIFF_WORKERS at a time
+		try:
+			errors = [e for e in TIFF_POOL.map(_bitmap_to_tiff, pages) if e is not None]
+		finally:
+			if speller is not None: speller.close()
+
+		if errors:
+			logr.error(str(len(errors)) + ' of ' + str(len(pages)) + ' pages failed for ' + pdf_obj.host_c_id + ':')
+			for e in errors:
+				logr.error('  ' + e)
+			# keep the bitmaps that are left, so that those pages can be redone
+			raise StageError(str(len(errors)) + ' pages failed; bitmaps kept in ' + pdf_obj.bitmaps_dir)
 		
 		# delete the bitmap dir
 		if rm_bitmaps:
@@ -341,83 +529,565 @@ def bitmaps_to_tiff(pdf_obj, rm_bitmaps=True):
 		else:
 			logr.warn("rm_bitmaps set to False. This is intended for debugging and will fill the disk quickly.")
 	
-def tiffs_to_jp2(pdf_obj):
+def pdf_to_tiff(pdf_obj, scratch_root):
+	"""
+	Make the TIFFs straight from the PDF, a page at a time (TIFF_WORKERS pages
+	at once): pdfimages extracts just that page's images, each is read once, 
+	oriented and normalized in memory (see _write_tiff), and the bitmaps are
+	removed before the next page. Pages are numbered as they are by 
+	extract_bitmaps_from_pdf + bitmaps_to_tiff, but no more than a few pages' 
+	bitmaps are ever on disk, in a scratch dir under scratch_root (the EAD's
+	run dir, so that it goes, or is kept, with the rest of the run).
+	"""
+	if pdf_obj.pdf_resp_status == 200 and os.path.exists(pdf_obj.pdf_local_path):
+		pdf_obj.tiffs_dir = os.path.join(TIFFS_LOCAL_ROOT, pdf_obj.host_c_id.replace('_', os.sep))
+		if pdf_obj.pdf_idx > 0: 
+			pdf_obj.tiffs_dir = pdf_obj.tiffs_dir + '_' + str(pdf_obj.pdf_idx)
+		pdf_obj.tiffs_dir = pdf_obj.tiffs_dir + os.sep
+		logr.debug('tiffs_dir for ' + pdf_obj.host_c_id + ": " + pdf_obj.tiffs_dir)
+
+		if not os.path.exists(pdf_obj.tiffs_dir):
+			os.makedirs(pdf_obj.tiffs_dir, 0755)
+			logr.debug('made: ' + pdf_obj.tiffs_dir)
+		_remove_partials(pdf_obj.tiffs_dir)
+
+		# page -> the numbers pdfimages gives its images, in order, and the
+		# memory the biggest of them will need
+		by_page = {}
+		footprints = {}
+		for page, num, width, height, bits in _list_images(pdf_obj.pdf_local_path):
+			by_page.setdefault(page, []).append(num)
+			footprints[page] = max(footprints.get(page, 0), _page_footprint((width, height), bits))
+
+		# anything left by an earlier run that was killed or failed
+		scratch_root = os.path.join(scratch_root, 'pdf2tiff')
+		prefix = _pdf_key(pdf_obj) + '-'
+		if os.path.exists(scratch_root):
+			for stale in os.listdir(scratch_root):
+				if stale.startswith(prefix):
+					logr.info('removing ' + stale + ', left by an earlier run')
+					rmtree(os.path.join(scratch_root, stale))
+		scratch_dir = make_scratch_dir(scratch_root, prefix)
+
+		# we don't know the bit depths until the images are out; aspell is 
+		# started by the first page that needs it
+		speller = LazySpeller(ASPELL)
+		jp2s_dir = None
+		if FUSED_JP2S: jp2s_dir = _make_jp2s_dir(pdf_obj)
+
+		jobs = []
+		for page in sorted(by_page):
+			jobs.append((pdf_obj.pdf_local_path, page, by_page[page], footprints[page], scratch_dir, 
+				pdf_obj.tiffs_dir, jp2s_dir, speller, pdf_obj.files, _pdf_key(pdf_obj)))
+		try:
+			results = TIFF_POOL.map(_page_to_tiff, jobs)
+		finally:
+			speller.close()
+
+		errors = [e for e, bits in results if e is not None]
+		for e, bits in results:
+			if bits is not None: pdf_obj.img_bits = bits
+
+		remove_scratch_dir(scratch_dir, not errors)
+		if errors:
+			logr.error(str(len(errors)) + ' of ' + str(len(jobs)) + ' pages failed for ' + pdf_obj.host_c_id + ':')
+			for e in errors:
+				logr.error('  ' + e)
+			raise StageError(str(len(errors)) + ' pages failed')
+	else:
+		logr.debug(pdf_obj.src_url + " was not downloaded and/or does not exist on the filesystem")
+
+def _list_images(pdf_path):
+	"""
+	(page, image number, width, height, bits per pixel) for every image 
+	pdfimages would extract from a PDF.
+	"""
+	cmd = [PDFIMAGES, '-list', pdf_path]
+	proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	out, err = proc.communicate()
+	if proc.returncode != 0:
+		raise StageError('pdfimages -list exited ' + str(proc.returncode) + ' for ' + pdf_path + ': ' + err.strip())
+	images = []
+	for line in out.splitlines()[2:]: # after the header and the ---- line
+		fields = line.split()
+		if len(fields) > 7:
+			images.append((int(fields[0]), int(fields[1]), int(fields[3]), int(fields[4]), 
+				int(fields[6]) * int(fields[7])))
+	return images
+
+def _page_to_tiff(job):
+	"""
+	Make the TIFFs for one page of a PDF. Returns (None or a description of
+	what went wrong, the bit depth of the page's images or None).
+	"""
+	pdf_path, page, nums, footprint, scratch_dir, tiffs_dir, jp2s_dir, speller, files, pdf = job
+	tiff_names = [os.path.join(tiffs_dir, str(num + 1).zfill(8) + '.tif') for num in nums]
+	jp2_names = [None] * len(nums)
+	if jp2s_dir is not None:
+		jp2_names = [os.path.join(jp2s_dir, str(num + 1).zfill(8) + '.jp2') for num in nums]
+	if [t for t, j in zip(tiff_names, jp2_names) if not _page_done(t, j)] == []:
+		logr.info('page ' + str(page) + ' of ' + pdf_path + ' already done, will not regenerate.')
+		done = Image.open(tiff_names[-1])
+		try:
+			if done.mode == 'RGB': return None, 24
+			return None, 8
+		finally:
+			done.close()
+
+	prefix = os.path.join(scratch_dir, 'p' + str(page))
+	bits = None
+	claimed = _admit(footprint, pdf, 'pdf2tiff', pdf_path + ' page ' + str(page))
+	try:
+		pdfimages_cmd = PDFIMAGES + ' -f ' + str(page) + ' -l ' + str(page) + ' ' + pdf_path + ' ' + prefix
+		exit_code = _run(pdfimages_cmd, pdf=pdf, stage='pdf2tiff', src=None, dest=None)
+		if exit_code != 0:
+			return pdf_path + ' page ' + str(page) + ': pdfimages exited ' + str(exit_code), None
+		bmps = sorted(f for f in os.listdir(scratch_dir) if f.startswith('p' + str(page) + '-'))
+		if len(bmps) != len(nums):
+			return pdf_path + ' page ' + str(page) + ': expected ' + str(len(nums)) + ' images, got ' + str(len(bmps)), None
+
+		for bmp, tiff_name, jp2_name in zip(bmps, tiff_names, jp2_names):
+			bmp = os.path.join(scratch_dir, bmp)
+			bits = _bitmap_bits(bmp)
+			if _page_done(tiff_name, jp2_name):
+				continue
+			im = Image.open(bmp)
+			im.load()
+			im = _orient(im, bits, speller, pdf, 'pdf2tiff', bmp)
+			error = _make_page(im, bits, tiff_name, jp2_name, files, pdf, 'pdf2tiff', bmp)
+			del im
+			if error is not None:
+				return error, None
+	except Exception, e:
+		return pdf_path + ' page ' + str(page) + ': ' + str(e), None
+	finally:
+		MEMORY.release(claimed)
+		for f in os.listdir(scratch_dir):
+			if f.startswith('p' + str(page) + '-'):
+				os.remove(os.path.join(scratch_dir, f))
+	return None, bits
+
+def _bitmap_bits(bmp):
+	file_ext = os.path.splitext(bmp)[1]
+	if file_ext == '.pbm':
+		return 1
+	elif file_ext == '.pgm':
+		return 8
+	else:
+		return 24
+
+def _page_footprint(size, img_bits, copies=None):
+	"""
+	The memory (bytes) a page of size (width, height) and img_bits is 
+	expected to need: PIL keeps 1 and 8 bit pixels in a byte each and RGB in
+	four, and there are up to MEMORY_PAGE_COPIES of it (decoded, rotated, 
+	normalized, piped) at once.
+	"""
+	if copies is None: copies = MEMORY_PAGE_COPIES
+	width, height = size
+	if img_bits > 8: depth = 4
+	else: depth = 1
+	return width * height * depth * copies
+
+def _admit(cost, pdf, stage, item):
+	"""
+	Claim cost bytes of the MEMORY budget, waiting for room if need be (the 
+	wait is recorded as a memory_wait step). Returns what to release.
+	"""
+	start = time.time()
+	claimed = MEMORY.acquire(cost)
+	waited = time.time() - start
+	if waited > 0.01:
+		logr.debug(item + ' waited %.2fs for %d MB of memory' % (waited, cost / 1048576))
+		STATS.record('step', 'memory_wait', pdf, stage, item, start, waited)
+	return claimed
+
+def _page_number(bmp, default):
+	"""
+	The page number for a bitmap, from the count pdfimages puts in its name
+	(x-000.pbm is page 1).
+	"""
+	m = _PDFIMAGES_NAME.search(os.path.basename(bmp))
+	if m is None: return default
+	return int(m.group(1)) + 1
+
+def _remove_partials(dir):
+	"""
+	Remove anything left under a temporary name by an interrupted run.
+	"""
+	for f in os.listdir(dir):
+		if '.part' in f:
+			os.remove(os.path.join(dir, f))
+			logr.warn('removed incomplete file: ' + os.path.join(dir, f))
+
+def _run(cmd, env=None, pdf=None, stage=None, src=None, dest=None, name=None, input=None):
+	"""
+	Run a shell command (with input, if given, on its stdin), log its output,
+	and return the exit code. Its time is recorded in STATS (as name, or the 
+	command's own name) for the pdf and stage it was run for, along with the
+	sizes of its input or src and dest (files or directories), if given.
+	"""
+	if name is None: name = os.path.basename(cmd.split()[0])
+	stdin = None
+	if input is not None: stdin = subprocess.PIPE
+	start = time.time()
+	proc = Process(cmd, shell=True, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+	out, err = proc.communicate(input)
+	wall = time.time() - start
+	if input is not None: bytes_in = len(input)
+	else: bytes_in = size_of(src)[0]
+	bytes_out, pages = size_of(dest)
+	STATS.record('call', name, pdf, stage, src, start, wall, proc.cpu(), bytes_in, bytes_out, pages)
+	logr.debug('exit: ' + str(proc.returncode))
+	for line in out.splitlines():
+		logr.debug(line.rstrip())
+	for line in err.splitlines():
+		logr.error(line.rstrip())
+	return proc.returncode
+
+def _convert_cmd(src, long_side, img_bits, dest):
+	"""
+	The convert command that makes a normalized TIFF of the image at src (a
+	file, or PNM:- for stdin): the long side rounded down to a multiple of 100,
+	8 bits per channel, and the sRGB or gray ICC profile.
+	"""
+	rounded = target_long_side(long_side)
+	resize = str(rounded) + 'x' + str(rounded) + '\>'
+
+	convert_cmd = CONVERT + ' ' + src + ' -resize ' + resize + ' -quality 100 '
+	if img_bits == 24: convert_cmd = convert_cmd + '-profile ' + SRGB_PROFILE + ' '
+	else: convert_cmd = convert_cmd + '-depth 8 -profile ' + GRAY_PROFILE + ' '
+	convert_cmd = convert_cmd + 'TIFF:' + dest
+	logr.debug('convert_cmd: ' + convert_cmd)
+	return convert_cmd
+
+def _orient(im, img_bits, speller, pdf, stage, item):
+	"""
+	Return a page (a PIL image) turned right side up, if it is text-based
+	(generally bitonal or grayscale); as it is otherwise.
+	"""
+	if img_bits == 24:
+		return im
+	start = time.time()
+	direction, im = orientation(im, speller, OCRAD)
+	STATS.record('step', 'orient', pdf, stage, item, start, time.time() - start, pages=1)
+	logr.debug('orientation of ' + item + ': ' + direction)
+	return im
+
+def _write_tiff(im, img_bits, part_name, pdf, stage, item):
+	"""
+	Write a page (a PIL image) as a normalized TIFF at part_name, in process 
+	(normalize.py) or, if [tiffs] engine is convert, by piping it to convert.
+	Returns (None or a description of what went wrong, the normalized image 
+	if we have it).
+	"""
+	if TIFF_ENGINE == 'pil':
+		start = time.time()
+		normalized = normalize_to_tiff(im, img_bits, part_name, SRGB_PROFILE, GRAY_PROFILE)
+		STATS.record('step', 'normalize', pdf, stage, item, start, time.time() - start, 
+			bytes_out=os.path.getsize(part_name), pages=1)
+		return None, normalized
+	buf = StringIO()
+	im.save(buf, 'PPM')
+	convert_cmd = _convert_cmd('PNM:-', max(im.size), img_bits, part_name)
+	exit_code = _run(convert_cmd, pdf=pdf, stage=stage, dest=part_name, input=buf.getvalue())
+	if exit_code != 0:
+		return item + ': convert exited ' + str(exit_code), None
+	return None, None
+
+def _make_page(im, img_bits, tiff_name, jp2_name, files, pdf, stage, item):
+	"""
+	Write a decoded page's TIFF (if it isn't there yet) and, if jp2_name is 
+	given, its JP2 from the same normalized raster, so that the TIFF is never
+	read back. Returns None on success, or a description of what went wrong.
+	"""
+	normalized = None
+	if not os.path.exists(tiff_name):
+		# written under a temporary name and renamed when complete
+		part_name = tiff_name + '.part'
+		try:
+			error, normalized = _write_tiff(im, img_bits, part_name, pdf, stage, item)
+			if error is not None:
+				return error
+			os.rename(part_name, tiff_name)
+
+			# while it's still in the page cache
+			files[os.path.normpath(tiff_name)] = describeFile(tiff_name)
+		finally:
+			if os.path.exists(part_name): os.remove(part_name)
+
+	if jp2_name is None or os.path.exists(jp2_name):
+		return None
+	if normalized is None: # the TIFF was made by an earlier run
+		return _tiff_to_jp2((tiff_name, jp2_name, img_bits == 24, files, pdf), admit=False)
+	return _image_to_jp2(normalized, jp2_name, img_bits == 24, files, pdf, stage)
+
+def _page_done(tiff_name, jp2_name):
+	"""
+	True if a page's TIFF (and JP2, if we're making it too) are already made.
+	"""
+	return os.path.exists(tiff_name) and (jp2_name is None or os.path.exists(jp2_name))
+
+def _bitmap_to_tiff(page):
+	"""
+	Orient (if need be) and convert a single bitmap. Returns None on success, 
+	or a description of what went wrong.
+	"""
+	bmp, tiff_name, rm_bitmaps, speller, files, pdf, jp2_name = page
+	img_bits = _bitmap_bits(bmp)
+
+	if _page_done(tiff_name, jp2_name):
+		logr.info(tiff_name + ' already exists, will not regenerate.')
+		if rm_bitmaps: os.remove(bmp)
+		return None
+
+	try:
+		if os.path.exists(tiff_name): # but not the JP2
+			error = _tiff_to_jp2((tiff_name, jp2_name, img_bits == 24, files, pdf))
+		else:
+			# read once; rotated (in memory) if text-based (generally bitonal 
+			# or grayscale), then normalized. Only the header is read until 
+			# there's room for the rest.
+			im = Image.open(bmp)
+			claimed = _admit(_page_footprint(im.size, img_bits), pdf, 'tiff', bmp)
+			try:
+				im.load()
+				im = _orient(im, img_bits, speller, pdf, 'tiff', bmp)
+				error = _make_page(im, img_bits, tiff_name, jp2_name, files, pdf, 'tiff', bmp)
+				del im
+			finally:
+				MEMORY.release(claimed)
+		if error is not None:
+			return error
+	except Exception, e:
+		return bmp + ': ' + str(e)
+
+	# delete the bitmap
+	if rm_bitmaps:
+		os.remove(bmp)
+	else:
+		logr.warn("rm_bitmaps set to False. This is intended for debugging and will fill the disk quickly.")
+
+	return None
+
+def _make_jp2s_dir(pdf_obj):
+	"""
+	Figure out (and make, if necessary) a Pdf's jp2s_dir, and clear anything
+	an interrupted run left in it. Returns it.
+	"""
+	pdf_obj.jp2s_dir = os.path.join(JP2S_LOCAL_ROOT, pdf_obj.host_c_id.replace('_', os.sep))
 	
-	if int(pdf_obj.pdf_resp_status) == 200 and os.path.exists(pdf_obj.tiffs_dir):
-		# figure out the path to the output dir
-		pdf_obj.jp2s_dir = os.path.join(JP2S_ROOT, pdf_obj.host_c_id.replace('_', os.sep))
+	if pdf_obj.pdf_idx > 0: 
+		pdf_obj.jp2s_dir = pdf_obj.jp2s_dir + '_' + str(pdf_obj.pdf_idx)
 		
-		if int(pdf_obj.pdf_idx) > 0: 
-			pdf_obj.jp2s_dir = pdf_obj.jp2s_dir + '_' + pdf_obj.pdf_idx
-			
-		pdf_obj.jp2s_dir = pdf_obj.jp2s_dir + os.sep
-		logr.debug('jp2s_dir for ' + pdf_obj.host_c_id + ": " + pdf_obj.jp2s_dir)
-		
-		# make the output dir if necessary
-		if not os.path.exists(pdf_obj.jp2s_dir):
+	pdf_obj.jp2s_dir = pdf_obj.jp2s_dir + os.sep
+	logr.debug('jp2s_dir for ' + pdf_obj.host_c_id + ": " + pdf_obj.jp2s_dir)
+	
+	# make the output dir if necessary
+	if not os.path.exists(pdf_obj.jp2s_dir):
+		try:
 			os.makedirs(pdf_obj.jp2s_dir, 0755)
 			logr.debug('made: ' + pdf_obj.jp2s_dir)
+		except OSError:
+			if not os.path.isdir(pdf_obj.jp2s_dir): raise
 	
-		
+	_remove_partials(pdf_obj.jp2s_dir)
+	return pdf_obj.jp2s_dir
+
+def tiffs_to_jp2(pdf_obj):
+	
+	if pdf_obj.pdf_resp_status == 200 and os.path.exists(pdf_obj.tiffs_dir):
+		_make_jp2s_dir(pdf_obj)
+
 		files = os.listdir(pdf_obj.tiffs_dir)
 		files.sort()
+		tiffs = []
 		for tiff in files:
 			jp2 = tiff.replace(os.path.splitext(tiff)[1], ".jp2")
 			jp2 = os.path.join(pdf_obj.jp2s_dir, jp2)
-			
-			if not os.path.exists(jp2):
-				tiff = os.path.join(pdf_obj.tiffs_dir, tiff)
+			tiff = os.path.join(pdf_obj.tiffs_dir, tiff)
+			tiffs.append((tiff, jp2, pdf_obj.img_bits == 24, pdf_obj.files, _pdf_key(pdf_obj)))
+
+		# JP2_WORKERS encodes at once, each with KDU_THREADS threads
+		errors = [e for e in JP2_POOL.map(_tiff_to_jp2, tiffs) if e is not None]
+
+		if errors:
+			logr.error(str(len(errors)) + ' of ' + str(len(tiffs)) + ' JP2s failed for ' + pdf_obj.host_c_id + ':')
+			for e in errors:
+				logr.error('  ' + e)
+			raise StageError(str(len(errors)) + ' JP2s failed')
+
+def _kdu_cmd(src, dest, size, srgb):
+	"""
+	The kdu_compress command that encodes the image at src (a TIFF, or a PGM
+	or PPM) as a JP2 at dest, and the number of levels it asks for, from the
+	long side (size) of the image.
+	"""
+	level_dim = int(size)
+	min = 96
+	levelcount = 0
+	while level_dim >= min:
+		levelcount += 1
+		level_dim = level_dim / 2
 		
-				# figure out the # of levels
-				img_file = open(tiff, 'r')
-				im = Image.open(img_file)
-				size = max(im.size)
-				img_file.close()
-				
-				level_dim = int(size)
-				min = 96
-				levelcount = 0
-				while level_dim >= min:
-					levelcount += 1
-					level_dim = level_dim / 2
-					
-				logr.debug('long side: ' + str(size))
-				logr.debug('levels: ' + str(levelcount))
-				
-				# build the command
-				compress_cmd = _BIN + os.sep + 'kdu_compress -i ' + tiff + ' -o ' + jp2 + ' '
-				compress_cmd = compress_cmd + '-rate 1.2,0.7416334477,0.4583546103,0.2832827752,0.1750776907,0.1082041271,0.0668737897,0.0413302129 Clayers=8 '
-				compress_cmd = compress_cmd + 'Clevels=' + str(levelcount) + ' '
-				compress_cmd = compress_cmd + 'Cuse_precincts=yes Cprecincts=\{256,256\} Cblk=\{64,64\} Cuse_sop=yes '
-				compress_cmd = compress_cmd + 'Cuse_eph=yes Corder=RPCL ORGgen_plt=yes ORGtparts=R Stiles=\{256,256\} '
-				if pdf_obj.img_bits == 24: compress_cmd = compress_cmd + '-jp2_space sRGB '
-				compress_cmd = compress_cmd + '-double_buffering 10 -num_threads 4 -no_weights ' # -quiet
-				logr.debug('compress_cmd: ' + compress_cmd)
-				
-				# execute
-				compress_proc = subprocess.Popen(compress_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=_ENV)
-				exit_code = compress_proc.wait()
-				logr.debug('exit: ' + str(exit_code))
-				 
-				for line in compress_proc.stdout:
-					logr.debug(line.rstrip())
-				for line in compress_proc.stderr:
-					logr.error(line.rstrip())
+	logr.debug('long side: ' + str(size))
+	logr.debug('levels: ' + str(levelcount))
 	
-				logr.debug('')
-				
-			else:
-				logr.error(jp2 + ' exists; will not regenerate.')
+	# build the command
+	compress_cmd = _BIN + os.sep + 'kdu_compress -i ' + src + ' -o ' + dest + ' '
+	compress_cmd = compress_cmd + '-rate 1.2,0.7416334477,0.4583546103,0.2832827752,0.1750776907,0.1082041271,0.0668737897,0.0413302129 Clayers=8 '
+	compress_cmd = compress_cmd + 'Clevels=' + str(levelcount) + ' '
+	compress_cmd = compress_cmd + 'Cuse_precincts=yes Cprecincts=\{256,256\} Cblk=\{64,64\} Cuse_sop=yes '
+	compress_cmd = compress_cmd + 'Cuse_eph=yes Corder=RPCL ORGgen_plt=yes ORGtparts=R Stiles=\{256,256\} '
+	if srgb: compress_cmd = compress_cmd + '-jp2_space sRGB '
+	compress_cmd = compress_cmd + '-double_buffering 10 -num_threads ' + str(KDU_THREADS) + ' -no_weights ' # -quiet
+	logr.debug('compress_cmd: ' + compress_cmd)
+	return compress_cmd, levelcount
+
+def _kdu_run(compress_cmd, pdf, stage, src, dest):
+	"""
+	Run a kdu_compress command once one of the JP2_WORKERS slots is free, so
+	that encodes started from the TIFF workers (fused) don't oversubscribe 
+	the CPUs. Returns (exit code, seconds it ran).
+	"""
+	JP2_SLOTS.acquire()
+	try:
+		start = time.time()
+		exit_code = _run(compress_cmd, env=_ENV, pdf=pdf, stage=stage, src=src, dest=dest)
+		return exit_code, time.time() - start
+	finally:
+		JP2_SLOTS.release()
+
+def _feed(path, im, errors):
+	"""
+	Write im to path (a named pipe, or a file) as a PGM or PPM. Any error is
+	put on errors.
+	"""
+	try:
+		f = open(path, 'wb')
+		try:
+			im.save(f, 'PPM')
+		finally:
+			f.close()
+	except Exception, e:
+		errors.append(e)
+
+def _image_to_jp2(im, jp2, srgb, files, pdf, stage):
+	"""
+	Encode a normalized page (a PIL image, L or RGB) as a JP2, handing the
+	raster straight to kdu_compress through a named pipe (or, if [tiffs] 
+	kdu_input is file, a temporary PGM/PPM), so that the TIFF isn't read back.
+	Returns None on success, or a description of what went wrong. If it went
+	wrong, the scratch dir is kept, with the raster in it as a file, so that
+	the encode can be tried again by hand.
+	"""
+	part_name = os.path.splitext(jp2)[0] + '.part.jp2'
+	if im.mode == 'RGB': ext = '.ppm'
+	else: ext = '.pgm'
+	raw_dir = make_scratch_dir(os.path.join(TMP_DIR, 'kdu'), os.path.basename(jp2) + '-')
+	raw = os.path.join(raw_dir, 'page' + ext)
+	errors = []
+	error = None
+	try:
+		if KDU_INPUT == 'pipe':
+			os.mkfifo(raw, 0600)
+			feeder = threading.Thread(target=_feed, args=(raw, im, errors))
+			feeder.daemon = True
+			feeder.start()
+		else:
+			feeder = None
+			_feed(raw, im, errors)
+
+		size = max(im.size)
+		compress_cmd, levelcount = _kdu_cmd(raw, part_name, size, srgb)
+		exit_code, elapsed = _kdu_run(compress_cmd, pdf, stage, None, part_name)
+		logr.info('encoded ' + jp2 + ' in %.2fs (long side: %d, levels: %d, threads: %d)' % (elapsed, size, levelcount, KDU_THREADS))
+
+		if feeder is not None:
+			if feeder.is_alive():
+				# kdu_compress never opened the pipe; let the feeder's open 
+				# return (and its writes fail) so that it can finish
+				fd = os.open(raw, os.O_RDONLY | os.O_NONBLOCK)
+				os.close(fd)
+			feeder.join()
+		if exit_code != 0:
+			error = jp2 + ': kdu_compress exited ' + str(exit_code)
+		elif errors:
+			error = jp2 + ': ' + str(errors[0])
+		else:
+			os.rename(part_name, jp2)
+
+			# while it's still in the page cache
+			files[os.path.normpath(jp2)] = describeFile(jp2)
+	except Exception, e:
+		error = jp2 + ': ' + str(e)
+	finally:
+		if os.path.exists(part_name): os.remove(part_name)
+		if error is not None and KDU_INPUT == 'pipe':
+			# the pipe is no use for debugging; the raster that went into it is
+			try:
+				if os.path.exists(raw): os.remove(raw)
+				im.save(raw, 'PPM')
+			except Exception, e:
+				logr.error('could not keep the raster for ' + jp2 + ': ' + str(e))
+		remove_scratch_dir(raw_dir, error is None)
+
+	return error
+
+def _tiff_to_jp2(tiff_job, admit=True):
+	"""
+	Encode a single TIFF as a JP2. Returns None on success, or a description
+	of what went wrong. If admit is True, room for the raster is claimed from 
+	the MEMORY budget first (not if the caller already holds a page's claim).
+	"""
+	tiff, jp2, srgb, files, pdf = tiff_job
+
+	if os.path.exists(jp2):
+		logr.info(jp2 + ' exists; will not regenerate.')
+		return None
+
+	# written under a temporary name (kdu_compress goes by the extension) and
+	# renamed when complete
+	part_name = os.path.splitext(jp2)[0] + '.part.jp2'
+	claimed = 0
+	try:
+		# figure out the # of levels
+		img_file = open(tiff, 'r')
+		im = Image.open(img_file)
+		size = max(im.size)
+		if admit:
+			if im.mode == 'RGB': img_bits = 24
+			else: img_bits = 8
+			claimed = _admit(_page_footprint(im.size, img_bits, 1), pdf, 'jp2', tiff)
+		img_file.close()
 		
-	
-def pdf_obj_to_mets(pdf_obj):
+		compress_cmd, levelcount = _kdu_cmd(tiff, part_name, size, srgb)
+		
+		# execute
+		exit_code, elapsed = _kdu_run(compress_cmd, pdf, 'jp2', tiff, part_name)
+		logr.info('encoded ' + jp2 + ' in %.2fs (long side: %d, levels: %d, threads: %d)' % (elapsed, size, levelcount, KDU_THREADS))
+		if exit_code != 0:
+			return tiff + ': kdu_compress exited ' + str(exit_code)
+		os.rename(part_name, jp2)
+
+		# while it's still in the page cache
+		files[os.path.normpath(jp2)] = describeFile(jp2)
+	except Exception, e:
+		return tiff + ': ' + str(e)
+	finally:
+		MEMORY.release(claimed)
+		if os.path.exists(part_name): os.remove(part_name)
+
+	return None
+
+def pdf_obj_to_mets(pdf_obj, scratch_root):
 	# make the METS, calculate file sizes 
-	if int(pdf_obj.pdf_resp_status) == 200 and os.path.exists(pdf_obj.jp2s_dir):
+	if pdf_obj.pdf_resp_status == 200 and os.path.exists(pdf_obj.jp2s_dir):
 		
 		# figure out the local path
-		pdf_obj.mets_path = os.path.join(METS_ROOT, pdf_obj.host_c_id.replace('_', os.sep))
-		if int(pdf_obj.pdf_idx) > 0: 
-			pdf_obj.mets_path = pdf_obj.mets_path + '_' + pdf_obj.pdf_idx
+		pdf_obj.mets_path = os.path.join(METS_LOCAL_ROOT, pdf_obj.host_c_id.replace('_', os.sep))
+		if pdf_obj.pdf_idx > 0: 
+			pdf_obj.mets_path = pdf_obj.mets_path + '_' + str(pdf_obj.pdf_idx)
 			
 		pdf_obj.mets_path = pdf_obj.mets_path + '.mets'
 		logr.debug('METS path for ' + pdf_obj.host_c_id + ": " + pdf_obj.jp2s_dir)
@@ -428,89 +1098,152 @@ def pdf_obj_to_mets(pdf_obj):
 			os.makedirs(dir, 0755)
 			logr.debug('made: ' + dir) 
 		
-		# build the command. We're shelling out to a bit of old python code 
-		# that I can't bear to visit again.
 		objid = pdf_obj.host_c_id.replace('_', '/')
-		if int(pdf_obj.pdf_idx) > 0: 
-			objid = objid + '_' + pdf_obj.pdf_idx
+		if pdf_obj.pdf_idx > 0: 
+			objid = objid + '_' + str(pdf_obj.pdf_idx)
 			
-		pdf_obj.mets_uri = pdf_obj.mets_path.replace(METS_ROOT, 'http://findingaids.princeton.edu/folders')
-		
-		tmp_out = TMP_DIR + os.sep + 'folder.xml'
-		
-		dao_cmd = PYTHON + ' ' + _BIN + os.sep + 'dao.py '
-		dao_cmd = dao_cmd + '--output ' + tmp_out + ' '
-		dao_cmd = dao_cmd + '--objid ' + objid + ' '
-		dao_cmd = dao_cmd + '--docid ' + pdf_obj.mets_uri + ' '
-		for input in (pdf_obj.pdf_local_path, pdf_obj.tiffs_dir[:-1], pdf_obj.jp2s_dir[:-1]): # trailing slashes we causing problems
-			dao_cmd = dao_cmd + '--input ' + input + ' '
-		
-		logr.debug('dao_cmd: ' + dao_cmd)
-		
-		# execute
-#		dao_proc = subprocess.Popen(dao_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-		dao_proc = subprocess.Popen(dao_cmd, shell=True)
-		exit_code = dao_proc.wait()
-		logr.debug('exit: ' + str(exit_code))
-			 
-#		for line in dao_proc.stdout:
-#			logr.debug(line.rstrip())
-#		for line in dao_proc.stderr:
-#			logr.error(line.rstrip())
-		
-		
-		# xslt: subprocess this:
-		saxon_cmd = JAVA + ' -jar ' + _LIB + os.sep + 'saxon9he.jar ' 
-		saxon_cmd = saxon_cmd + '-xsl:' + _LIB + os.sep + 'folder2mets.xsl '
-		saxon_cmd = saxon_cmd + '-s:' + tmp_out + ' -o:' + pdf_obj.mets_path + ' '
-		saxon_cmd = saxon_cmd + 'title="' + pdf_obj.pdf_title + '"'
-		logr.debug('saxon_cmd: ' + saxon_cmd)
-		
-		saxon_proc = subprocess.Popen(saxon_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-		exit_code = saxon_proc.wait()
-		logr.debug('exit: ' + str(exit_code))
-			 
-		for line in saxon_proc.stdout:
-			logr.debug(line.rstrip())
-		for line in saxon_proc.stderr:
-			logr.error(line.rstrip())
+		pdf_obj.mets_uri = pdf_obj.mets_path.replace(METS_LOCAL_ROOT, 'http://findingaids.princeton.edu/folders')
 		
+		# this Pdf's own scratch dir, so that METS can be made in parallel (only 
+		# used if Saxon has to be run from the command line)
+		scratch_dir = make_scratch_dir(scratch_root, pdf_obj.host_c_id + '_' + str(pdf_obj.pdf_idx) + '-')
+
+		# the folder XML that folder2mets.xsl turns into METS, written under a 
+		# temporary name and renamed when complete
+		ok = False
+		part_path = pdf_obj.mets_path + '.part'
+		inputs = (pdf_obj.pdf_local_path, pdf_obj.tiffs_dir[:-1], pdf_obj.jp2s_dir[:-1]) # trailing slashes we causing problems
+		try:
+			try:
+				folder_xml = folderXml(objid, pdf_obj.mets_uri, inputs, PROBE_WORKERS, pdf_obj.files, VERIFY_CHECKSUMS)
+			except Exception:
+				logr.exception('could not make the folder XML for ' + objid)
+			else:
+				# xslt
+				ok = folder_to_mets(folder_xml, part_path, pdf_obj.pdf_title, scratch_dir, _pdf_key(pdf_obj))
+			if ok:
+				os.rename(part_path, pdf_obj.mets_path)
+		finally:
+			if os.path.exists(part_path): os.remove(part_path)
+
+		remove_scratch_dir(scratch_dir, ok)
+		if not ok:
+			raise StageError('no METS for ' + objid)
+
+def folder_to_mets(folder_xml, mets_path, title, scratch_dir, pdf=None):
+	"""
+	Transform a folder document (from dao.folderXml) into METS at mets_path with
+	folder2mets.xsl. Uses the long-running Saxon worker when there is one, 
+	and a new Saxon for this document otherwise. Returns True on success.
+	"""
+	if SAXON is not None:
+		try:
+			start = time.time()
+			mets = SAXON.transform(folder_xml, title)
+			STATS.record('step', 'saxon-worker', pdf, 'mets', mets_path, start, time.time() - start,
+				bytes_in=len(folder_xml), bytes_out=len(mets))
+			f = open(mets_path, 'wb')
+			try:
+				f.write(mets)
+			finally:
+				f.close()
+			return True
+		except SaxonError, e:
+			logr.error('folder2mets.xsl failed for ' + mets_path + ': ' + str(e))
+			return False
+		except (IOError, ValueError), e:
+			logr.error('Saxon worker failed (' + str(e) + '); falling back to the command line')
+
+	folder_path = scratch_dir + os.sep + 'folder.xml'
+	if not os.path.exists(folder_path):
+		f = open(folder_path, 'wb')
+		try:
+			f.write(folder_xml)
+		finally:
+			f.close()
+
+	saxon_cmd = JAVA + ' -jar ' + _LIB + os.sep + 'saxon9he.jar ' 
+	saxon_cmd = saxon_cmd + '-xsl:' + FOLDER2METS + ' '
+	saxon_cmd = saxon_cmd + '-s:' + folder_path + ' -o:' + mets_path + ' '
+	saxon_cmd = saxon_cmd + 'title="' + title + '"'
+	logr.debug('saxon_cmd: ' + saxon_cmd)
+	return _run(saxon_cmd, pdf=pdf, stage='mets', src=folder_path, dest=mets_path, name='saxon') == 0
+
+def make_scratch_dir(parent, prefix):
+	"""
+	Make a new, uniquely named scratch dir under parent.
+	"""
+	if not os.path.exists(parent):
+		try:
+			os.makedirs(parent, 0755)
+		except OSError:
+			if not os.path.isdir(parent): raise
+	return tempfile.mkdtemp(prefix=prefix, dir=parent)
+
+def remove_scratch_dir(path, succeeded):
+	"""
+	Remove a scratch dir if the work done in it succeeded; otherwise leave it
+	for debugging.
+	"""
+	if succeeded:
+		rmtree(path)
+	else:
+		logr.error('keeping scratch dir for debugging: ' + path)
 
 
-def update_ead(ead_path, pdf_objs):
-	doc = libxml2.parseFile(ead_path)
+def update_ead(ead_path, pdf_objs, doc=None, parsed_mtime=None, dry_run=False):
+	"""
+	Revise the daos for pdf_objs in the EAD at ead_path: all of the changes are
+	made in memory and the EAD is written once, to a temporary file that is then
+	renamed over the original. doc, if given, is the EAD as parsed by get_pdfs
+	when its mtime was parsed_mtime; it is used as long as the file hasn't 
+	changed since, and the caller frees it. If 
+	dry_run is True, the changes are logged but nothing is written. Returns the
+	number of daos changed.
+	"""
+	own_doc = doc is None or parsed_mtime != os.path.getmtime(ead_path)
+	if own_doc:
+		if doc is not None:
+			logr.warn(ead_path + ' changed while we were working on it; reading it again')
+		doc = libxml2.parseFile(ead_path)
 	root = doc.getRootElement()
 	xlink_ns = root.searchNsByHref(doc, _XLINK_NS)
 	ead_ns = root.searchNsByHref(doc, _EAD_NS)
 
-	ctxt = doc.xpathNewContext()
-	ctxt.xpathRegisterNs('xlink', _XLINK_NS)
-	ctxt.xpathRegisterNs('ead', _EAD_NS)
+	changed = 0
 	try:
+		dao_index = index_daos(doc)
 		for pdf_obj in pdf_objs:
-			src_dao_xpath = "//ead:dao[@xlink:href='" + pdf_obj.src_url + "'][1]"
-			logr.debug('src_dao_xpath: ' + src_dao_xpath)
-			src_dao = ctxt.xpathEval(src_dao_xpath)[0]
+			src_dao = dao_index[pdf_obj.src_url].node
 			# check the object:
-			if pdf_obj.pdf_resp_status == '401':
+			if pdf_obj.pdf_resp_status == 401:
 				# xlink:show="none" to existing dao. Log it.
 				logr.info(pdf_obj.src_url + ' returned a 401 (Unauthorized).')
 				src_dao.setNsProp(xlink_ns, 'show', 'none')
 				logr.info('xlink:show="none" has been added to the dao')
-				doc.saveFormatFileEnc(ead_path, "UTF-8", 1)
+				if dry_run: _log_planned(pdf_obj, 'add xlink:show="none" to ' + pdf_obj.src_url)
+				changed += 1
 				
-			elif pdf_obj.pdf_resp_status == '404':
+			elif pdf_obj.pdf_resp_status == 404:
 				logr.error(pdf_obj.src_url + ' returned a 404 (Not Found).')
 				src_dao.setNsProp(xlink_ns, 'show', 'none')
 				logr.warn('xlink:show="none" has been added to the dao')
-				doc.saveFormatFileEnc(ead_path, "UTF-8", 1)
+				if dry_run: _log_planned(pdf_obj, 'add xlink:show="none" to ' + pdf_obj.src_url)
+				changed += 1
 				
-			elif pdf_obj.pdf_resp_status == '200':
+			elif pdf_obj.pdf_resp_status == 200:
 				all_accounted_for = True
+				# never link to a METS that didn't make it to the final roots
+				unpublished = []
+				if not dry_run: unpublished = _unpublished(pdf_obj)
+				for part in unpublished:
+					all_accounted_for = False
+					logr.error('Not in the final roots: ' + part)
 				for part in (pdf_obj.pdf_local_path, pdf_obj.mets_path, pdf_obj.tiffs_dir, pdf_obj.jp2s_dir):
-					if not os.path.exists(part):
+					# None if the Pdf stopped before the stage that makes it
+					if part is None or not os.path.exists(part):
 						all_accounted_for = False
-						logr.error('Missing: ' + part)
+						logr.error('Missing: ' + str(part))
 					elif os.path.isdir(part):
 						if len(os.listdir(part)) == 0:
 							all_accounted_for = False
@@ -529,93 +1262,202 @@ def update_ead(ead_path, pdf_objs):
 					src_dao.setNsProp(xlink_ns, 'href', pdf_obj.mets_uri)
 					
 					logr.debug('Modified PDF dao: ' + str(src_dao))
-					doc.saveFormatFileEnc(ead_path, "UTF-8", 1)
+					if dry_run: _log_planned(pdf_obj, pdf_obj.src_url + ' -> ' + str(pdf_obj.mets_uri) + ' (xlink:role METS)')
+					changed += 1
 				else:
 					logr.error('dao ' + pdf_obj.src_url + ' will not be changed')
 				# check the object, if all is good, append a new dao
 				# we ultimately want to replace, but not until pulfa 1.0 is out of prod.
 			else:
-	 			logr.error('Unhandled HTTP response (' + pdf_obj.pdf_resp_status + ') for ' + pdf_obj.src_url)
+	 			logr.error('Unhandled HTTP response (' + str(pdf_obj.pdf_resp_status) + ') for ' + pdf_obj.src_url)
+
+		if dry_run:
+			logr.info('Dry run: ' + str(changed) + ' dao(s) in ' + ead_path + ' would have been changed')
+		elif changed > 0:
+			save_ead(doc, ead_path)
+			logr.info(str(changed) + ' dao(s) in ' + ead_path + ' changed')
 	finally:
-		ctxt.xpathFreeContext()
-		doc.freeDoc()
+		if own_doc: doc.freeDoc()
+	return changed
+
+def _log_planned(pdf_obj, change):
+	"""
+	Log a change a dry run would have made to a Pdf's dao.
+	"""
+	logr.info('Dry run: ' + str(pdf_obj.host_c_id) + ': ' + change)
+
+def save_ead(doc, ead_path):
+	"""
+	Write doc over the EAD at ead_path in one go: to a temporary file next to
+	it, then renamed into place, so that readers never see half an EAD.
+	"""
+	tmp_path = ead_path + '.part'
+	try:
+		# libxml2 says it failed (e.g. a full disk) by returning -1
+		if doc.saveFormatFileEnc(tmp_path, "UTF-8", 1) < 0:
+			raise IOError('could not write ' + tmp_path + '; ' + ead_path + ' left as it was')
+		copymode(ead_path, tmp_path)
+		os.rename(tmp_path, ead_path)
+	finally:
+		if os.path.exists(tmp_path): os.remove(tmp_path)
 			
-def finalize(pdf_objs):
-	# TODO: move the files to their permanent homes, carefully asserting that 
-	# they're not overwriting anything (if not os.path.exists(dest): <copy>)
+def _final_roots():
+	"""
+	(Pdf attr, local root, final root) for each part of a Pdf that is moved.
+	"""
+	return (('pdf_local_path', PDFS_LOCAL_ROOT, PDFS_FINAL_ROOT),
+		('mets_path', METS_LOCAL_ROOT, METS_FINAL_ROOT),
+		('tiffs_dir', TIFFS_LOCAL_ROOT, TIFFS_FINAL_ROOT),
+		('jp2s_dir', JP2S_LOCAL_ROOT, JP2S_FINAL_ROOT))
+
+def _unpublished(pdf_obj):
+	"""
+	The parts of a Pdf that aren't (yet) under their final roots.
+	"""
+	parts = []
+	for attr, local_root, final_root in _final_roots():
+		path = getattr(pdf_obj, attr)
+		if path is None or not path.startswith(final_root):
+			parts.append(str(path))
+	return parts
+
+def finalize(pdf_objs, store=None):
+	"""
+	Move each Pdf's PDF, TIFFs, JP2s and METS from the local roots to their 
+	permanent homes (see transfer.py), never overwriting anything. The Pdf's
+	paths are updated as each part is moved, so that we can check again when
+	we update the EAD. Parts an earlier (interrupted) run already moved are 
+	left where they are. If a move fails, the Pdf's finalize stage is 
+	recorded as failed in store (if given).
+	"""
 	for pdf_obj in pdf_objs:
 
 		all_parts_exist = True
-		for part in (pdf_obj.pdf_local_path, pdf_obj.mets_path, pdf_obj.tiffs_dir, pdf_obj.jp2s_dir):
-			if not os.path.exists(part): 
+		moves = []
+		for attr, local_root, final_root in _final_roots():
+			src = getattr(pdf_obj, attr)
+			if src is None:
+				dest = None
+			else:
+				dest = src.replace(local_root, final_root)
+			if src is not None and src == dest:
+				continue # moved by an earlier run
+			if src is None or not (os.path.exists(src) or os.path.exists(dest)):
 				all_parts_exist = False
-				logr.error(pdf_obj.host_c_id + ' will not be moved because ' + part + ' is missing')
+				logr.error(pdf_obj.host_c_id + ' will not be moved because ' + str(src) + ' is missing')
+			else:
+				moves.append((attr, src, dest))
 
+		if not all_parts_exist:
+			continue
 
-		if all_parts_exist:
-			final_pdf = pdf_obj.pdf_local_path.replace(PDFS_LOCAL_ROOT, PDFS_FINAL_ROOT)
-			logr.debug('final_pdf: ' + final_pdf)
-			final_tiff_dir = pdf_obj.tiffs_dir.replace(TIFFS_LOCAL_ROOT, TIFFS_FINAL_ROOT)
-			logr.debug('final_tiff_dir: ' + final_tiff_dir)
-			
-			# PDF
-			pdf_final_dir = os.path.dirname(final_pdf)
-			if not os.path.exists(pdf_final_dir):
-				os.makedirs(pdf_final_dir, 0755)
-				logr.info("Made " + pdf_final_dir)
-				
-			if not os.path.exists(final_pdf):
-				copy(pdf_obj.pdf_local_path, final_pdf)
-				os.remove(pdf_obj.pdf_local_path)
-				pdf_obj.pdf_local_path = final_pdf # so that we can check again when we update the ead
-			else:
-				logr.error(final_pdf + ' exists, will not replace it.')
-				logr.error('The new pdf may still be at ' + pdf_obj.pdf_local_path)
-			
-			# TIFF
-			if not os.path.exists(final_tiff_dir):
-				os.makedirs(final_tiff_dir, 0755)
-				logr.info("Made " + final_tiff_dir)
-				for f in os.listdir(pdf_obj.tiffs_dir):
-					f = os.path.join(pdf_obj.tiffs_dir, f)
-					copy(f, final_tiff_dir)
-					os.remove(f)
-				
-				pdf_obj.tiffs_dir = final_tiff_dir # so that we can check again when we update the ead
-				
-			else:
-				logr.error(final_tiff_dir + ' exists, will not replace or update it.')
-				logr.error('The files may still be at ' + pdf_obj.tiffs_dir)
-			
-		
+		failed = []
+		for attr, src, dest in moves:
+			logr.debug('final ' + attr + ': ' + dest)
+			try:
+				if attr in ('pdf_local_path', 'mets_path'):
+					# PDF and METS
+					info = pdf_obj.files.get(os.path.normpath(src))
+					move_file(src, dest, info['checksum'] if info else None, TRANSFER_BLOCK_SIZE)
+					_moved(pdf_obj, src, dest)
+				else:
+					# TIFFs and JP2s
+					if os.path.exists(src): names = os.listdir(src)
+					else: names = os.listdir(dest)
+					move_dir(src, dest, TRANSFER_POOL, pdf_obj.files, TRANSFER_BLOCK_SIZE)
+					logr.info('Moved ' + src + ' to ' + dest)
+					for name in names:
+						_moved(pdf_obj, os.path.join(src, name), os.path.join(dest, name))
+			except (TransferError, IOError, OSError), e:
+				logr.error(str(e))
+				logr.error('The new file(s) may still be at ' + src)
+				failed.append(attr)
+				continue
+			setattr(pdf_obj, attr, dest)
 
+		if store is not None:
+			store.start_stage(pdf_obj, 'finalize')
+			error = None
+			if failed: error = 'could not move ' + ', '.join(failed)
+			store.finish_stage(pdf_obj, 'finalize', error)
+
+def _moved(pdf_obj, src, dest):
+	"""
+	Carry what we recorded about a file over to its new path.
+	"""
+	info = pdf_obj.files.pop(os.path.normpath(src), None)
+	if info is not None:
+		pdf_obj.files[os.path.normpath(dest)] = info
+
+def _workers(conf, option):
+	"""
+	Read a worker count from the [concurrency] section; 0 means one per CPU.
+	"""
+	workers = conf.getint('concurrency', option)
+	if workers <= 0: workers = cpu_count()
+	return workers
+
+def _jp2_split(conf):
+	"""
+	Split the CPUs between concurrent kdu_compress processes and Kakadu's own
+	threads. Either (or both) may be set in [concurrency]; whatever is left at
+	0 is worked out from the CPU count. Page images are small, so when neither 
+	is set we favor more processes with fewer threads each.
+	"""
+	cpus = cpu_count()
+	workers = conf.getint('concurrency', 'jp2_workers')
+	threads = conf.getint('concurrency', 'kdu_threads')
+	if threads <= 0:
+		if workers > 0: threads = max(1, cpus / workers)
+		elif cpus >= 4: threads = 2
+		else: threads = 1
+	if workers <= 0:
+		workers = max(1, cpus / threads)
+	return workers, threads
 
 def _setup():
 	# explicit
-	global _XLINK_NS, _EAD_NS, _METS_NS
+	global _XLINK_NS, _EAD_NS, _METS_NS, _METS_ROLE
 	
 	# computed
-	global _LIB, _BIN, _ETC, _ENV, SRGB_PROFILE, GRAY_PROFILE
+	global _LIB, _BIN, _ETC, _ENV, SRGB_PROFILE, GRAY_PROFILE, FOLDER2METS
 	
 	# read from conf
 	global TIFFS_LOCAL_ROOT, TIFFS_FINAL_ROOT, PDFS_LOCAL_ROOT, PDFS_FINAL_ROOT
-	global JP2S_ROOT, METS_ROOT, TMP_DIR, BITMAPS_ROOT
+	global JP2S_LOCAL_ROOT, JP2S_FINAL_ROOT, METS_LOCAL_ROOT, METS_FINAL_ROOT
+	global TMP_DIR, BITMAPS_ROOT
 	global logr
 	
 	# utilities (also read from conf)
-	global PDFIMAGES, CONVERT, PYTHON, JAVA
+	global PDFIMAGES, CONVERT, JAVA, OCRAD, ASPELL
+
+	# concurrency (also read from conf)
+	global DOWNLOAD_WORKERS, DOWNLOAD_CHUNK_SIZE, TIFF_WORKERS
+	global JP2_WORKERS, KDU_THREADS, EAD_WORKERS, STAGE_WORKERS, STAGE_QUEUE_SIZE
+	global PROBE_WORKERS, VERIFY_CHECKSUMS, TRANSFER_WORKERS, TRANSFER_BLOCK_SIZE
+	global DIRECT_TIFFS, TIFF_ENGINE, FUSED_JP2S, KDU_INPUT, STREAM_SCAN
+
+	# shared by every EAD in this process
+	global SESSION, DOWNLOAD_POOL, TIFF_POOL, JP2_POOL, JP2_SLOTS, TRANSFER_POOL, SAXON
+	global CACHE, DEAD_TTL, FETCHER, MEMORY, MEMORY_PAGE_COPIES
+
+	# instrumentation
+	global STATS, STATS_DIR, STATS_SLOWEST
 
 	_LIB = os.path.dirname(os.getcwd()) + "/lib"
 	_BIN = os.path.dirname(os.getcwd()) + "/bin"
 	_ETC = os.path.dirname(os.getcwd()) + "/etc"
 	SRGB_PROFILE = _LIB + os.sep + 'sRGB.icc'
 	GRAY_PROFILE = _LIB + os.sep + 'gray22.icc'
+	FOLDER2METS = _LIB + os.sep + 'folder2mets.xsl'
 	
 	_ENV = { "LD_LIBRARY_PATH":_LIB }
 
 	_XLINK_NS = "http://www.w3.org/1999/xlink"
 	_EAD_NS = "urn:isbn:1-931666-22-9"
 	_METS_NS = "http://www.loc.gov/METS/"
+	# what a dao's xlink:role is compared with to tell that it's a METS
+	_METS_ROLE = _METS_NS
 	
 	# Logging
 	logging.config.fileConfig(_ETC + '/logging.conf')
@@ -631,81 +1473,301 @@ def _setup():
 	PDFS_LOCAL_ROOT = conf.get('directories', 'pdfs_local_root')
 	PDFS_FINAL_ROOT = conf.get('directories', 'pdfs_final_root')
 	
-	JP2S_ROOT = conf.get('directories', 'jp2s_final_root')
+	JP2S_LOCAL_ROOT = conf.get('directories', 'jp2s_local_root')
+	JP2S_FINAL_ROOT = conf.get('directories', 'jp2s_final_root')
 	
-	METS_ROOT = conf.get('directories', 'mets_final_root')
+	METS_LOCAL_ROOT = conf.get('directories', 'mets_local_root')
+	METS_FINAL_ROOT = conf.get('directories', 'mets_final_root')
 	
 	TMP_DIR = conf.get('directories', 'tmp')
 	BITMAPS_ROOT = conf.get('directories', 'bitmaps_root')
 	
 	PDFIMAGES = conf.get('utilities', 'pdfimages')
 	CONVERT = conf.get('utilities', 'convert')
-	PYTHON = conf.get('utilities', 'python')
 	JAVA = conf.get('utilities', 'java')
+	OCRAD = conf.get('utilities', 'ocrad')
+	ASPELL = conf.get('utilities', 'aspell')
+
+	DOWNLOAD_WORKERS = conf.getint('concurrency', 'download_workers')
+	DOWNLOAD_CHUNK_SIZE = conf.getint('concurrency', 'download_chunk_size')
+	TIFF_WORKERS = _workers(conf, 'tiff_workers')
+	JP2_WORKERS, KDU_THREADS = _jp2_split(conf)
+	EAD_WORKERS = conf.getint('concurrency', 'ead_workers')
+	STAGE_WORKERS = conf.getint('concurrency', 'stage_workers')
+	STAGE_QUEUE_SIZE = conf.getint('concurrency', 'stage_queue_size')
+	PROBE_WORKERS = conf.getint('concurrency', 'probe_workers')
+	TRANSFER_WORKERS = conf.getint('concurrency', 'transfer_workers')
+	TRANSFER_BLOCK_SIZE = conf.getint('concurrency', 'transfer_block_size')
+	VERIFY_CHECKSUMS = conf.getboolean('checksums', 'verify')
+	DIRECT_TIFFS = conf.getboolean('tiffs', 'direct')
+	TIFF_ENGINE = conf.get('tiffs', 'engine')
+	FUSED_JP2S = conf.getboolean('tiffs', 'fused')
+	KDU_INPUT = conf.get('tiffs', 'kdu_input')
+	STREAM_SCAN = conf.getboolean('eads', 'stream_scan')
+
+	STATS = Stats()
+	STATS_DIR = conf.get('stats', 'dir')
+	STATS_SLOWEST = conf.getint('stats', 'slowest')
+
+	CACHE = DownloadCache(conf.get('downloads', 'cache'))
+	DEAD_TTL = conf.getint('downloads', 'dead_ttl')
+
+	SESSION = requests.Session()
+	# shared by the download workers of every EAD batch.py runs at once
+	adapter = HTTPAdapter(pool_connections=DOWNLOAD_WORKERS, pool_maxsize=DOWNLOAD_WORKERS * EAD_WORKERS)
+	SESSION.mount('http://', adapter)
+	SESSION.mount('https://', adapter)
+	FETCHER = Fetcher(SESSION,
+		connect_timeout=conf.getfloat('downloads', 'connect_timeout'),
+		read_timeout=conf.getfloat('downloads', 'read_timeout'),
+		retries=conf.getint('downloads', 'retries'),
+		backoff=conf.getfloat('downloads', 'backoff'),
+		max_backoff=conf.getfloat('downloads', 'max_backoff'),
+		host_workers=conf.getint('downloads', 'host_workers'),
+		host_rate=conf.getfloat('downloads', 'host_rate'))
+
+	# what the TIFF and JP2 workers may hold in decoded pages, all together
+	budget_mb = conf.getint('memory', 'budget_mb')
+	if budget_mb == 0:
+		budget = (physical_memory() or 0) / 2
+	else:
+		budget = budget_mb * 1048576
+	MEMORY = MemoryBudget(budget)
+	MEMORY_PAGE_COPIES = conf.getint('memory', 'page_copies')
+	if budget > 0:
+		logr.debug('memory budget for pages: %d MB' % (budget / 1048576))
+
+	DOWNLOAD_POOL = ThreadPool(DOWNLOAD_WORKERS)
+	TIFF_POOL = ThreadPool(TIFF_WORKERS)
+	JP2_POOL = ThreadPool(JP2_WORKERS)
+	# kdu_compress runs at once, whichever pool starts them
+	JP2_SLOTS = threading.BoundedSemaphore(JP2_WORKERS)
+	TRANSFER_POOL = ThreadPool(TRANSFER_WORKERS)
+
+	# folder2mets.xsl is compiled once, for all of the METS we make
+	if SaxonWorker.available(_LIB):
+		SAXON = SaxonWorker(JAVA, _LIB, FOLDER2METS)
+	else:
+		SAXON = None
+		logr.warn('lib/SaxonWorker.class not found; starting Saxon for every METS')
 	
 	if not os.path.exists(TMP_DIR):	os.makedirs(TMP_DIR)
 
+	if FUSED_JP2S and TIFF_ENGINE != 'pil':
+		logr.warn('[tiffs] fused needs engine=pil; making the JP2s from the TIFFs')
+		FUSED_JP2S = False
 
-if __name__ == '__main__':
-	# ead = "/home/jstroop/workspace/pulfa1.0/eads/mudd/publicpolicy/MC216.EAD.xml"
-	ead = argv[1]
-	 
-	_setup()
 
-	report_path = os.path.join(TMP_DIR, "pdfs.txt")
+class _Done():
+	"""
+	Put on a stage's queue to tell one of its workers to stop.
+	"""
+	pass
 
-	pdf_objects = get_pdfs(ead)
-	
-	# write these out so that we can stop and start.
-	Pdf.serialize(report_path, pdf_objects)
+# what each stage reads and writes (Pdf attributes), for STATS
+_STAGE_IO = {
+	'download': ((), ('pdf_local_path',)),
+	'bitmaps': (('pdf_local_path',), ('bitmaps_dir',)),
+	'tiff': (('bitmaps_dir',), ('tiffs_dir', 'jp2s_dir')),
+	'pdf2tiff': (('pdf_local_path',), ('tiffs_dir', 'jp2s_dir')),
+	'jp2': (('tiffs_dir',), ('jp2s_dir',)),
+	'mets': (('pdf_local_path', 'tiffs_dir', 'jp2s_dir'), ('mets_path',))
+}
 
-	del pdf_objects[:] # clear the list
+def _stage_size(pdf_obj, attrs):
+	"""
+	(bytes, files) at the paths in a Pdf's attrs. files is counted at the 
+	first only: for a stage that writes a directory of pages (and maybe their
+	JP2s too), it's the page count.
+	"""
+	total = 0
+	count = None
+	for attr in attrs:
+		b, c = size_of(getattr(pdf_obj, attr, None))
+		total += b
+		if count is None: count = c
+	return total, count or 0
 
-	logr.debug("-----------------------BITMAP EXTRACTION-----------------------------------")
-	pdf_objects = Pdf.slurp(report_path)
-	for pdf in pdf_objects:
-		logr.debug("---------------------------------------------------------------------------")
-		extract_bitmaps_from_pdf(pdf)
-	Pdf.serialize(report_path, pdf_objects)
+def _pdf_key(pdf_obj):
+	"""
+	A short name for a Pdf, e.g. MC216_c003 or MC216_c003_1.
+	"""
+	key = str(pdf_obj.host_c_id)
+	if pdf_obj.pdf_idx > 0: key = key + '_' + str(pdf_obj.pdf_idx)
+	return key
 
-	del pdf_objects[:] # clear the list
-	
-	logr.debug("-----------------------TIFF CONVERSION-------------------------------------")
-	pdf_objects = Pdf.slurp(report_path)
-	for pdf in pdf_objects:
-		logr.debug("---------------------------------------------------------------------------")
-		bitmaps_to_tiff(pdf, rm_bitmaps=True) # False WHILE DUBUGGING
-	Pdf.serialize(report_path, pdf_objects)
+def report_stats(name):
+	"""
+	Write a summary of STATS, as JSON, to STATS_DIR/<name>-<time>.json, and
+	log it as a table.
+	"""
+	summary = STATS.summary(STATS_SLOWEST)
+	if not os.path.exists(STATS_DIR):
+		os.makedirs(STATS_DIR, 0755)
+	path = os.path.join(STATS_DIR, name + '-' + time.strftime('%Y%m%d-%H%M%S') + '.json')
+	STATS.write_json(path, summary)
+	for line in STATS.table(summary, ('download', 'bitmaps', 'tiff', 'pdf2tiff', 'jp2', 'mets')):
+		logr.info(line)
+	logr.info('stats: ' + path)
+
+def run_stages(pdf_objs, stages, store, resume=False):
+	"""
+	Stream Pdf objects through a list of (name, function, workers) stages. 
+	Each stage has its own worker threads and a bounded (STAGE_QUEUE_SIZE) queue
+	in front of it, and a Pdf moves on to the next stage as soon as it is done
+	with the current one, so all of the stages are busy at once. Each Pdf, and
+	its progress, is saved to the JobStore after each stage. A Pdf whose stage 
+	raises is logged and goes no further. If resume is True, stages the store 
+	says a Pdf has already done are skipped.
+	"""
+	queues = [Queue(STAGE_QUEUE_SIZE) for stage in stages]
+	threads = []
 
-	del pdf_objects[:] # clear the list
+	def work(i):
+		name, function, workers = stages[i]
+		while True:
+			pdf_obj = queues[i].get()
+			if isinstance(pdf_obj, _Done):
+				return
+			if resume and store.is_done(pdf_obj, name):
+				logr.info(name + ' already done for ' + str(pdf_obj.src_url))
+				if i + 1 < len(stages): queues[i + 1].put(pdf_obj)
+				continue
+			start = store.start_stage(pdf_obj, name)
+			bytes_in = _stage_size(pdf_obj, _STAGE_IO[name][0])[0]
+			try:
+				function(pdf_obj)
+			except Exception, e:
+				logr.exception(name + ' failed for ' + str(pdf_obj.src_url) + '; it will go no further')
+				store.finish_stage(pdf_obj, name, str(e) or e.__class__.__name__)
+				continue
+			bytes_out, pages = _stage_size(pdf_obj, _STAGE_IO[name][1])
+			STATS.record('stage', name, _pdf_key(pdf_obj), name, pdf_obj.src_url, start, 
+				time.time() - start, None, bytes_in, bytes_out, pages)
+			store.finish_stage(pdf_obj, name)
+			if i + 1 < len(stages): queues[i + 1].put(pdf_obj)
 
-	logr.debug("-----------------------JP2 CONVERSION--------------------------------------")
-	pdf_objects = Pdf.slurp(report_path)
-	for pdf in pdf_objects:
-		logr.debug("---------------------------------------------------------------------------")
-		tiffs_to_jp2(pdf)
-	Pdf.serialize(report_path, pdf_objects)
-	
-	del pdf_objects[:] # clear the list
-	
-	logr.debug("-----------------------METS------------------------------------------------")
-	pdf_objects = Pdf.slurp(report_path)
-	for pdf in pdf_objects:
-		logr.debug("---------------------------------------------------------------------------")
-		pdf_obj_to_mets(pdf)
-	Pdf.serialize(report_path, pdf_objects)
+	for i in range(len(stages)):
+		stage_threads = []
+		for w in range(stages[i][2]):
+			t = threading.Thread(target=work, args=(i,), name=stages[i][0] + '-' + str(w))
+			t.daemon = True
+			t.start()
+			stage_threads.append(t)
+		threads.append(stage_threads)
 
-	del pdf_objects[:] # clear the list
+	for pdf_obj in pdf_objs:
+		queues[0].put(pdf_obj)
 
-	logr.debug("-----------------------FINALIZE FILES--------------------------------------")
-	pdf_objects = Pdf.slurp(report_path)
-	finalize(pdf_objects)
-	Pdf.serialize(report_path, pdf_objects)
-	
-	
-	logr.debug("-----------------------REVISE EAD------------------------------------------")
-	pdf_objects = Pdf.slurp(report_path)
-	update_ead(ead, pdf_objects)
+	# once a stage's workers have all stopped, nothing more can reach the next 
+	# one, so it can be told to stop too
+	for i in range(len(stages)):
+		for t in threads[i]:
+			queues[i].put(_Done())
+		for t in threads[i]:
+			t.join()
+
+def process_ead(ead, resume=False, dry_run=False):
+	"""
+	Run one EAD through the whole pipeline. If resume is True, pick up where
+	an earlier, interrupted, run on the same EAD left off: Pdfs keep what was
+	learned about them and skip the stages they finished, and within a stage 
+	only unfinished pages are redone. If dry_run is True, the changes to the 
+	EAD, and the files that would be moved to the final roots, are logged but
+	nothing is published.
+	"""
+	# scratch space (and the job store) for this EAD only, so that more than
+	# one EAD can be run at a time; keyed on the whole path, as EADs in 
+	# different directories can have the same name
+	ead_key = hashlib.sha1(os.path.abspath(ead)).hexdigest()[:12]
+	run_dir = os.path.join(TMP_DIR, 'runs', os.path.splitext(os.path.basename(ead))[0] + '-' + ead_key)
 
+	if not may_have_pdfs(ead):
+		logr.info('No PDF links in ' + ead + '; not parsing it.')
+		return
+
+	if STREAM_SCAN:
+		# scanned now, and parsed only at the end, to be revised
+		pdf_objects = get_pdfs(ead, download=False)
+		if pdf_objects == []:
+			return
+		ok = _process_pdfs(ead, None, None, pdf_objects, run_dir, resume, dry_run)
+	else:
+		# parsed once, for finding the PDFs and for revising their daos at the end
+		ead_mtime = os.path.getmtime(ead)
+		ead_doc = libxml2.parseFile(ead)
+		try:
+			pdf_objects = get_pdfs(ead, download=False, doc=ead_doc)
+			if pdf_objects == []:
+				return
+			ok = _process_pdfs(ead, ead_doc, ead_mtime, pdf_objects, run_dir, resume, dry_run)
+		finally:
+			ead_doc.freeDoc()
+
+	# if we made it, the job store is no longer needed; otherwise it (and the
+	# METS scratch dirs) are kept for --resume and for debugging
+	remove_scratch_dir(run_dir, ok)
+
+def _process_pdfs(ead, ead_doc, ead_mtime, pdf_objects, run_dir, resume, dry_run):
+	"""
+	The PDFs found in an EAD, through the stages, to their final homes, and
+	into the EAD. Returns True if every Pdf got through every stage.
+	"""
+	# keep track of these so that we can see how far we got.
+	store = JobStore(os.path.join(run_dir, 'jobs.db'))
+	try:
+		if resume:
+			saved = dict((p.src_url, p) for p in store.load(Pdf))
+			for pdf_obj in pdf_objects:
+				if pdf_obj.src_url in saved:
+					pdf_obj.__dict__.update(saved[pdf_obj.src_url].__dict__)
+					logr.info('resuming ' + pdf_obj.src_url)
+		else:
+			store.clear()
+		store.save_all(pdf_objects)
+
+		logr.debug("-----------------------DOWNLOAD -> BITMAPS -> TIFF -> JP2 -> METS--------")
+		stages = [('download', lambda pdf: download_pdf(FETCHER, pdf), DOWNLOAD_WORKERS)]
+		if DIRECT_TIFFS:
+			stages.append(('pdf2tiff', lambda pdf: pdf_to_tiff(pdf, run_dir), STAGE_WORKERS))
+		else:
+			stages.append(('bitmaps', extract_bitmaps_from_pdf, STAGE_WORKERS))
+			stages.append(('tiff', lambda pdf: bitmaps_to_tiff(pdf, rm_bitmaps=True), STAGE_WORKERS)) # False WHILE DUBUGGING
+		if not FUSED_JP2S:
+			stages.append(('jp2', tiffs_to_jp2, STAGE_WORKERS))
+		stages.append(('mets', lambda pdf: pdf_obj_to_mets(pdf, run_dir), STAGE_WORKERS))
+		run_stages(pdf_objects, stages, store, resume)
+
+		logr.debug("-----------------------FINALIZE FILES--------------------------------------")
+		if dry_run:
+			for pdf_obj in pdf_objects:
+				if pdf_obj.pdf_resp_status == 200:
+					parts = [str(p) for p in (pdf_obj.pdf_local_path, pdf_obj.mets_path, 
+						pdf_obj.tiffs_dir, pdf_obj.jp2s_dir)]
+					logr.info('Dry run: would move ' + ', '.join(parts) + ' to the final roots')
+		else:
+			finalize(pdf_objects, store)
+			store.save_all(pdf_objects)
+		
+		logr.debug("-----------------------REVISE EAD------------------------------------------")
+		update_ead(ead, pdf_objects, ead_doc, ead_mtime, dry_run)
+		return store.failures() == 0
+	finally:
+		store.close()
+
+if __name__ == '__main__':
+	# ead = "/home/jstroop/workspace/pulfa1.0/eads/mudd/publicpolicy/MC216.EAD.xml"
+	parser = ArgumentParser()
+	parser.add_argument("--resume", action="store_true", dest="resume")
+	parser.add_argument("--dry-run", action="store_true", dest="dry_run")
+	parser.add_argument("ead")
+	args = parser.parse_args()
+	 
+	_setup()
+
+	try:
+		process_ead(args.ead, args.resume, args.dry_run)
+	finally:
+		report_stats(os.path.splitext(os.path.basename(args.ead))[0])
 
 	exit(0)
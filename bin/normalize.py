@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# In-process replacement for the convert command that normalizes each page:
+#
+#  convert page -resize NxN\> -quality 100 [-depth 8] -profile X.icc TIFF:out
+#
+# The page is decoded once (by the caller, who usually has it in memory for
+# orientation already), shrunk with a Lanczos filter (convert's default for
+# downsampling) so that its long side is a multiple of 100, made 8 bit gray or
+# RGB, and written as an uncompressed TIFF with the ICC profile embedded.
+#
+#===============================================================================
+
+from PIL import Image
+import threading
+
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+def _profile(path):
+	"""
+	The bytes of an ICC profile, read once.
+	"""
+	_profiles_lock.acquire()
+	try:
+		if path not in _profiles:
+			f = open(path, 'rb')
+			try:
+				_profiles[path] = f.read()
+			finally:
+				f.close()
+		return _profiles[path]
+	finally:
+		_profiles_lock.release()
+
+def target_long_side(long_side):
+	"""
+	The long side a page is shrunk to: rounded to a multiple of 100, never up.
+	"""
+	rounded = int(round(long_side, -2))
+	if rounded > long_side: rounded = rounded - 100
+	return rounded
+
+def target_size(size):
+	"""
+	The size of a page after -resize NxN\>, where N is target_long_side, or
+	None if it doesn't need resizing.
+	"""
+	w, h = size
+	long_side = max(w, h)
+	n = target_long_side(long_side)
+	if n <= 0 or n >= long_side:
+		return None
+	scale = n / float(long_side)
+	return (max(1, int(w * scale + 0.5)), max(1, int(h * scale + 0.5)))
+
+def normalize(im, img_bits):
+	"""
+	Return im shrunk to its target size and made 8 bit RGB (img_bits 24) or
+	gray (anything else).
+	"""
+	if img_bits == 24: mode = 'RGB'
+	else: mode = 'L'
+	if im.mode != mode:
+		im = im.convert(mode)
+	size = target_size(im.size)
+	if size is not None:
+		im = im.resize(size, Image.ANTIALIAS)
+	return im
+
+# the TIFF tag an embedded ICC profile goes in
+ICC_PROFILE_TAG = 34675
+
+def save_tiff(im, path, profile_path):
+	"""
+	Write im as an uncompressed TIFF at path with the ICC profile at
+	profile_path embedded. Raises IOError if the profile didn't make it in.
+	"""
+	profile = _profile(profile_path)
+	# older Pillows (6.2, the last for Python 2) only write the profile from
+	# im.info for TIFFs, and ignore icc_profile=; im is the caller's, so its
+	# info is swapped for a copy while we save
+	info = im.info
+	im.info = dict(info)
+	im.info['icc_profile'] = profile
+	try:
+		im.save(path, 'TIFF', icc_profile=profile)
+	finally:
+		im.info = info
+
+	saved = Image.open(path)
+	try:
+		embedded = ICC_PROFILE_TAG in saved.tag_v2
+	finally:
+		saved.close()
+	if not embedded:
+		raise IOError(path + ': ' + profile_path + ' was not embedded')
+
+def normalize_to_tiff(im, img_bits, path, srgb_profile, gray_profile):
+	"""
+	normalize and save_tiff in one go, with the sRGB profile for 24 bit pages
+	and the gray one for the rest. Returns the normalized image, e.g. for the
+	JP2.
+	"""
+	if img_bits == 24: profile = srgb_profile
+	else: profile = gray_profile
+	im = normalize(im, img_bits)
+	save_tiff(im, path, profile)
+	return im
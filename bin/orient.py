@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# Page orientation for main.py, in process (this replaced orient_image.sh).
+#
+# Makes the four 90 degree variants of a page in memory, OCRs each, and picks
+# the one with the fewest misspelled words from the two with the fewest
+# "words" (least whitespace junk)--the same choice the shell script made, but
+# without temp files, convert, cp, wc, sort and a new aspell per page.
+#
+# Dependencies:
+#  * ocrad (apt-get install ocrad)
+#  * aspell (apt-get install aspell)
+#
+#===============================================================================
+
+from PIL import Image
+from StringIO import StringIO
+import subprocess
+import threading
+
+OCRAD = '/usr/bin/ocrad'
+ASPELL = '/usr/bin/aspell'
+
+# convert -rotate is clockwise, PIL's transpose constants are counter-clockwise
+ROTATIONS = (
+	('north', None),
+	('east', Image.ROTATE_270),
+	('south', Image.ROTATE_180),
+	('west', Image.ROTATE_90)
+)
+
+class Speller(object):
+	"""
+	A long-running `aspell -a` (ispell pipe mode), so that the dictionary is
+	loaded once and shared by every page (and thread) that needs it.
+	"""
+	def __init__(self, aspell=ASPELL, lang='en'):
+		cmd = [aspell, '-a', '-l', lang, '--encoding=utf-8']
+		self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+		self.proc.stdout.readline() # version banner
+		self.lock = threading.Lock()
+
+	def misspelled(self, text):
+		"""
+		Return the number of misspelled words in text.
+		"""
+		count = 0
+		self.lock.acquire()
+		try:
+			for line in text.splitlines():
+				# '^' keeps lines from being read as pipe-mode commands
+				self.proc.stdin.write('^' + line + '\n')
+				self.proc.stdin.flush()
+				# one result line per word of interest, then a blank line
+				result = self.proc.stdout.readline()
+				while result.strip() != '':
+					if result[0] in ('&', '#'): count += 1
+					result = self.proc.stdout.readline()
+		finally:
+			self.lock.release()
+		return count
+
+	def close(self):
+		self.proc.stdin.close()
+		self.proc.wait()
+
+class LazySpeller(object):
+	"""
+	A Speller that isn't started until the first page needs a spell check, so
+	that a PDF with no text-based pages never starts aspell. Safe to share
+	between threads, like Speller.
+	"""
+	def __init__(self, aspell=ASPELL, lang='en'):
+		self.aspell = aspell
+		self.lang = lang
+		self.speller = None
+		self.lock = threading.Lock()
+
+	def misspelled(self, text):
+		self.lock.acquire()
+		try:
+			if self.speller is None:
+				self.speller = Speller(self.aspell, self.lang)
+		finally:
+			self.lock.release()
+		return self.speller.misspelled(text)
+
+	def close(self):
+		if self.speller is not None: self.speller.close()
+
+def ocr(im, ocrad=OCRAD):
+	"""
+	OCR a PIL image by piping it to ocrad as PNM. Returns the text.
+	"""
+	buf = StringIO()
+	im.save(buf, 'PPM')
+	cmd = [ocrad, '-F', 'utf8', '-']
+	proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	out, err = proc.communicate(buf.getvalue())
+	if proc.returncode != 0:
+		raise RuntimeError('ocrad exited ' + str(proc.returncode) + ': ' + err.strip())
+	return out
+
+def orientation(im, speller, ocrad=OCRAD):
+	"""
+	Return (name, image) for the most likely upright variant of im.
+	"""
+	candidates = []
+	for name, method in ROTATIONS:
+		if method is None: rotated = im
+		else: rotated = im.transpose(method)
+		text = ocr(rotated, ocrad)
+		# (word count, name) sorts the way `sort -n` did the wc table
+		candidates.append((len(text.split()), name, rotated, text))
+	candidates.sort(key=lambda c: (c[0], c[1]))
+
+	# the bottom two are likely right side up and upside down; spellcheck
+	# them. Ties fall back to the rest of the line, as they did with sort.
+	scored = []
+	for words, name, rotated, text in candidates[:2]:
+		scored.append((speller.misspelled(text), str(words), name, rotated))
+	scored.sort(key=lambda s: (s[0], s[1], s[2]))
+
+	return scored[0][2], scored[0][3]
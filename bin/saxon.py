@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# A long-lived Saxon process (lib/SaxonWorker.java) that compiles a stylesheet
+# once and then transforms one document after another over stdin/stdout,
+# instead of a new JVM (and a new compile) for every document.
+#
+# Dependencies:
+#  * Java
+#  * lib/saxon9he.jar, and lib/SaxonWorker.class built against it:
+#    cd lib && javac -cp saxon9he.jar SaxonWorker.java
+#
+#===============================================================================
+
+import os
+import subprocess
+import threading
+
+class SaxonError(Exception):
+	"""
+	The stylesheet could not be applied to a document.
+	"""
+	pass
+
+class SaxonWorker(object):
+	"""
+	A running SaxonWorker for one stylesheet. transform() may be called from
+	any number of threads; documents are handed to the JVM one at a time.
+	"""
+	def __init__(self, java, lib, xsl):
+		classpath = os.path.join(lib, 'saxon9he.jar') + os.pathsep + lib
+		cmd = [java, '-cp', classpath, 'SaxonWorker', xsl]
+		self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+		self.lock = threading.Lock()
+
+	@staticmethod
+	def available(lib):
+		"""
+		True if SaxonWorker has been compiled.
+		"""
+		return os.path.exists(os.path.join(lib, 'SaxonWorker.class'))
+
+	def transform(self, doc, title):
+		"""
+		Transform doc (a serialized XML document) with the $title param set,
+		and return the result as a string.
+		"""
+		self.lock.acquire()
+		try:
+			self.proc.stdin.write(title + '\n')
+			self.proc.stdin.write(str(len(doc)) + '\n')
+			self.proc.stdin.write(doc)
+			self.proc.stdin.flush()
+
+			header = self.proc.stdout.readline()
+			if header == '':
+				raise IOError('SaxonWorker exited ' + str(self.proc.poll()))
+			status, length = header.split()
+			result = self.proc.stdout.read(int(length))
+		finally:
+			self.lock.release()
+
+		if status != 'OK':
+			raise SaxonError(result)
+		return result
+
+	def close(self):
+		self.proc.stdin.close()
+		self.proc.wait()
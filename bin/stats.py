@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# Timing and throughput for main.py: wall time, CPU time, bytes in and out
+# and pages for every stage a Pdf goes through, every subprocess (pdfimages,
+# convert, kdu_compress, Saxon) and the in-process steps that stand in for
+# them (orientation, the Saxon worker), and a summary of it all at the end of
+# a run, as JSON and as a table.
+#
+# CPU time is only known for subprocesses (from wait4); a stage's CPU time is
+# that of the subprocesses it ran for the Pdf.
+#
+#===============================================================================
+
+import errno
+import json
+import os
+import subprocess
+import threading
+import time
+
+class Process(subprocess.Popen):
+	"""
+	A Popen that keeps the resource usage of the child once it has been
+	waited for (rusage).
+	"""
+	rusage = None
+
+	def wait(self):
+		while self.returncode is None:
+			try:
+				pid, sts, self.rusage = os.wait4(self.pid, 0)
+			except OSError, e:
+				if e.errno == errno.EINTR: continue
+				if e.errno != errno.ECHILD: raise
+				sts = 0 # somebody else reaped it
+			self._handle_exitstatus(sts)
+		return self.returncode
+
+	def cpu(self):
+		"""
+		User + system seconds used by the child, or None if unknown.
+		"""
+		if self.rusage is None: return None
+		return self.rusage.ru_utime + self.rusage.ru_stime
+
+def size_of(path):
+	"""
+	(bytes, files) at path: a file, or a directory of files. (0, 0) if it
+	doesn't exist.
+	"""
+	if path is None or not os.path.exists(path):
+		return 0, 0
+	if os.path.isfile(path):
+		return os.path.getsize(path), 1
+	total = 0
+	count = 0
+	for f in os.listdir(path):
+		f = os.path.join(path, f)
+		if os.path.isfile(f):
+			total += os.path.getsize(f)
+			count += 1
+	return total, count
+
+def _mb(b):
+	return b / 1048576.0
+
+class Stats(object):
+	"""
+	Records for one run, from any number of threads. Each record is a dict of
+	kind (stage, call or step), name, pdf, stage, item, start, wall, cpu,
+	bytes_in, bytes_out and pages.
+	"""
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.records = []
+		self.started = time.time()
+
+	def record(self, kind, name, pdf=None, stage=None, item=None, start=None,
+			wall=0.0, cpu=None, bytes_in=0, bytes_out=0, pages=0):
+		r = {'kind': kind, 'name': name, 'pdf': pdf, 'stage': stage,
+			'item': item, 'start': start, 'wall': wall, 'cpu': cpu,
+			'bytes_in': bytes_in, 'bytes_out': bytes_out, 'pages': pages}
+		self.lock.acquire()
+		try:
+			self.records.append(r)
+		finally:
+			self.lock.release()
+		return r
+
+	def _aggregate(self, records):
+		agg = {'count': len(records), 'wall': 0.0, 'cpu': None, 'bytes_in': 0,
+			'bytes_out': 0, 'pages': 0}
+		for r in records:
+			agg['wall'] += r['wall']
+			if r['cpu'] is not None: agg['cpu'] = (agg['cpu'] or 0.0) + r['cpu']
+			for k in ('bytes_in', 'bytes_out', 'pages'):
+				agg[k] += r[k]
+		# rates over the time the stage was actually running (its records
+		# overlap), which is what we care about
+		starts = [r['start'] for r in records if r['start'] is not None]
+		if starts:
+			span = max(r['start'] + r['wall'] for r in records if r['start'] is not None) - min(starts)
+		else:
+			span = agg['wall']
+		agg['elapsed'] = span
+		if span > 0:
+			agg['pages_per_sec'] = agg['pages'] / span
+			agg['mb_in_per_sec'] = _mb(agg['bytes_in']) / span
+			agg['mb_out_per_sec'] = _mb(agg['bytes_out']) / span
+		else:
+			agg['pages_per_sec'] = agg['mb_in_per_sec'] = agg['mb_out_per_sec'] = None
+		return agg
+
+	def summary(self, slowest=5):
+		"""
+		A dict (that json can dump) of totals per stage, call and step, the
+		stages of each Pdf, and the slowest records of each stage and call.
+		"""
+		self.lock.acquire()
+		try:
+			records = list(self.records)
+		finally:
+			self.lock.release()
+
+		# a stage's CPU time is that of the subprocesses it ran
+		cpu = {}
+		for r in records:
+			if r['kind'] != 'stage' and r['cpu'] is not None:
+				key = (r['pdf'], r['stage'])
+				cpu[key] = cpu.get(key, 0.0) + r['cpu']
+		for r in records:
+			if r['kind'] == 'stage':
+				r['cpu'] = cpu.get((r['pdf'], r['name']))
+
+		groups = {}
+		for r in records:
+			groups.setdefault(r['kind'], {}).setdefault(r['name'], []).append(r)
+
+		summary = {'started': self.started, 'finished': time.time()}
+		for kind in ('stage', 'call', 'step'):
+			by_name = groups.get(kind, {})
+			summary[kind + 's'] = dict((name, self._aggregate(rs)) for name, rs in by_name.items())
+			summary['slowest_' + kind + 's'] = dict((name,
+				sorted(rs, key=lambda r: r['wall'], reverse=True)[:slowest])
+				for name, rs in by_name.items())
+
+		pdfs = {}
+		for r in groups.get('stage', {}).values():
+			for s in r:
+				pdfs.setdefault(s['pdf'], {})[s['name']] = dict((k, s[k]) for k in
+					('wall', 'cpu', 'bytes_in', 'bytes_out', 'pages'))
+		summary['pdfs'] = pdfs
+		return summary
+
+	def write_json(self, path, summary):
+		f = open(path, 'w')
+		try:
+			json.dump(summary, f, indent=1, sort_keys=True)
+		finally:
+			f.close()
+
+	def table(self, summary, order=()):
+		"""
+		summary as lines of text: one row per stage, call and step (stages in
+		order, if given), then the slowest of each.
+		"""
+		def fmt(v, spec):
+			if v is None: return '-'
+			return spec % v
+
+		lines = []
+		header = '%-14s %6s %9s %9s %9s %9s %7s %8s %8s %8s' % ('', 'count', 'elapsed',
+			'wall', 'cpu', 'MB in', 'pages', 'pages/s', 'MBin/s', 'MBout/s')
+		for kind in ('stage', 'call', 'step'):
+			aggs = summary[kind + 's']
+			if not aggs: continue
+			names = [n for n in order if n in aggs] + sorted(n for n in aggs if n not in order)
+			lines.append(kind.upper() + 'S')
+			lines.append(header)
+			for name in names:
+				a = aggs[name]
+				lines.append('%-14s %6d %9.1f %9.1f %9s %9.1f %7d %8s %8s %8s' % (name,
+					a['count'], a['elapsed'], a['wall'], fmt(a['cpu'], '%.1f'),
+					_mb(a['bytes_in']), a['pages'], fmt(a['pages_per_sec'], '%.2f'),
+					fmt(a['mb_in_per_sec'], '%.2f'), fmt(a['mb_out_per_sec'], '%.2f')))
+			lines.append('')
+
+		for kind in ('stage', 'call'):
+			slowest = summary['slowest_' + kind + 's']
+			for name in sorted(slowest):
+				lines.append('slowest ' + kind + ' ' + name + ':')
+				for r in slowest[name]:
+					if kind == 'stage': what = r['pdf']
+					else: what = r['item']
+					lines.append('  %9.2fs  %s' % (r['wall'], what))
+		return lines
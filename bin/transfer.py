@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# Moves finished files from the local (scratch) roots to their final homes.
+#
+# When the source and the destination are on the same filesystem a move is a
+# rename. Otherwise (e.g. /tmp to /mnt/diglibdata) the file is copied in large
+# blocks, under a temporary name, hashed on the way in and read back once it
+# is written; the copy is renamed into place, and the source removed, only if
+# both agree with each other and with the checksum recorded when the file was
+# made. Directories are copied a file at a time, several files at once.
+#
+#===============================================================================
+
+import hashlib
+import os
+import shutil
+
+BLOCKSIZE = 4194304
+
+class TransferError(Exception):
+	"""
+	A file could not be moved, or its copy did not match the original.
+	"""
+	pass
+
+def _existing(path):
+	"""
+	path, or its nearest ancestor that exists.
+	"""
+	path = os.path.abspath(path)
+	while not os.path.exists(path):
+		path = os.path.dirname(path)
+	return path
+
+def same_device(src, dest):
+	"""
+	True if src can be renamed to dest (which need not exist yet).
+	"""
+	return os.stat(src).st_dev == os.stat(_existing(dest)).st_dev
+
+def _sha1(path, blocksize):
+	hasher = hashlib.sha1()
+	f = open(path, 'rb')
+	try:
+		buf = f.read(blocksize)
+		while len(buf) > 0:
+			hasher.update(buf)
+			buf = f.read(blocksize)
+	finally:
+		f.close()
+	return hasher.hexdigest()
+
+def same_file(src, dest, checksum=None, blocksize=BLOCKSIZE):
+	"""
+	True if dest is already a copy of src: the same size and SHA-1 (checksum,
+	if given, or src's). If src is gone (moved by an earlier, interrupted, 
+	run), dest must match checksum.
+	"""
+	if not os.path.isfile(dest):
+		return False
+	if os.path.exists(src):
+		if os.path.getsize(src) != os.path.getsize(dest):
+			return False
+		if checksum is None: checksum = _sha1(src, blocksize)
+	elif checksum is None:
+		return False
+	return _sha1(dest, blocksize) == checksum
+
+def copy_verified(src, dest, checksum=None, blocksize=BLOCKSIZE):
+	"""
+	Copy src to dest (via dest.part) and check the copy: the SHA-1 of what was
+	read must match checksum (if given), and the SHA-1 of what is on disk at
+	the other end must match what was read. The source is left alone. Returns
+	the SHA-1.
+	"""
+	part = dest + '.part'
+	hasher = hashlib.sha1()
+	try:
+		fin = open(src, 'rb')
+		try:
+			fout = open(part, 'wb')
+			try:
+				buf = fin.read(blocksize)
+				while len(buf) > 0:
+					hasher.update(buf)
+					fout.write(buf)
+					buf = fin.read(blocksize)
+				fout.flush()
+				os.fsync(fout.fileno())
+			finally:
+				fout.close()
+		finally:
+			fin.close()
+
+		read = hasher.hexdigest()
+		if checksum is not None and read != checksum:
+			raise TransferError(src + ' has changed since it was made')
+		if _sha1(part, blocksize) != read:
+			raise TransferError('the copy of ' + src + ' at ' + dest + ' does not match it')
+
+		shutil.copymode(src, part)
+		os.rename(part, dest)
+	finally:
+		if os.path.exists(part): os.remove(part)
+	return read
+
+def move_file(src, dest, checksum=None, blocksize=BLOCKSIZE):
+	"""
+	Move src to dest (which must not exist), by rename if we can and by
+	copy_verified otherwise. If dest is already a copy of src (see same_file)
+	the move is finished off instead.
+	"""
+	if os.path.exists(dest):
+		if same_file(src, dest, checksum, blocksize):
+			if os.path.exists(src): os.remove(src)
+			return
+		raise TransferError(dest + ' exists, will not replace it')
+	parent = os.path.dirname(dest)
+	if not os.path.exists(parent):
+		os.makedirs(parent, 0755)
+	if same_device(src, dest):
+		os.rename(src, dest)
+	else:
+		copy_verified(src, dest, checksum, blocksize)
+		os.remove(src)
+
+def _same_dir(src, dest, known, blocksize):
+	"""
+	True if dest has a copy (see same_file) of every file in src, or, if src 
+	is gone, of every file in it we know the checksum of.
+	"""
+	if os.path.exists(src): names = os.listdir(src)
+	else: names = os.listdir(dest)
+	if not names:
+		return False
+	for name in names:
+		info = known.get(os.path.normpath(os.path.join(src, name)))
+		checksum = info['checksum'] if info is not None else None
+		if not same_file(os.path.join(src, name), os.path.join(dest, name), checksum, blocksize):
+			return False
+	return True
+
+def move_dir(src, dest, pool=None, known=None, blocksize=BLOCKSIZE):
+	"""
+	Move the directory src (of files) to dest, which must not exist. Across
+	filesystems the files are copied (with pool.map, if a pool is given) into
+	dest.part, which is renamed to dest once every copy has been verified; the
+	sources are removed after that. known is a dict of normalized path ->
+	describeFile() dict for the files whose checksums were recorded. If dest
+	already holds a copy of every file in src (an interrupted move), the move
+	is finished off instead.
+	"""
+	src = src.rstrip(os.sep)
+	dest = dest.rstrip(os.sep)
+	if known is None: known = {}
+	if os.path.exists(dest):
+		if _same_dir(src, dest, known, blocksize):
+			if os.path.exists(src): shutil.rmtree(src)
+			return
+		raise TransferError(dest + ' exists, will not replace or update it')
+	parent = os.path.dirname(dest)
+	if not os.path.exists(parent):
+		os.makedirs(parent, 0755)
+	if same_device(src, dest):
+		os.rename(src, dest)
+		return
+
+	part = dest + '.part'
+	if os.path.exists(part): # left by an interrupted move
+		shutil.rmtree(part)
+	os.makedirs(part, 0755)
+
+	def copy_one(name):
+		path = os.path.join(src, name)
+		info = known.get(os.path.normpath(path))
+		checksum = info['checksum'] if info is not None else None
+		copy_verified(path, os.path.join(part, name), checksum, blocksize)
+
+	names = sorted(os.listdir(src))
+	try:
+		if pool is not None: pool.map(copy_one, names)
+		else:
+			for name in names: copy_one(name)
+	except Exception:
+		shutil.rmtree(part)
+		raise
+	os.rename(part, dest)
+	shutil.rmtree(src)
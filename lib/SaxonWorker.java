@@ -0,0 +1,96 @@
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.EOFException;
+import java.io.File;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.OutputStream;
+
+import javax.xml.transform.stream.StreamSource;
+
+import net.sf.saxon.s9api.Processor;
+import net.sf.saxon.s9api.QName;
+import net.sf.saxon.s9api.SaxonApiException;
+import net.sf.saxon.s9api.Serializer;
+import net.sf.saxon.s9api.XdmAtomicValue;
+import net.sf.saxon.s9api.XsltExecutable;
+import net.sf.saxon.s9api.XsltTransformer;
+
+/**
+ * Compiles one stylesheet once and then transforms any number of documents
+ * with it, so that the JVM start-up and stylesheet compilation are paid once
+ * rather than once per document. Used by bin/saxon.py.
+ *
+ * Build (from lib/): javac -cp saxon9he.jar SaxonWorker.java
+ * Run: java -cp saxon9he.jar:. SaxonWorker folder2mets.xsl
+ *
+ * Requests on stdin, one after another:
+ *   title\n
+ *   length of the document in bytes\n
+ *   the document
+ *
+ * Responses on stdout:
+ *   OK length\n followed by the result, or
+ *   ERR length\n followed by an error message
+ */
+public class SaxonWorker {
+
+	public static void main(String[] args) throws Exception {
+		Processor processor = new Processor(false);
+		XsltExecutable stylesheet = processor.newXsltCompiler().compile(new StreamSource(new File(args[0])));
+
+		InputStream in = new BufferedInputStream(System.in);
+		OutputStream out = new BufferedOutputStream(System.out);
+
+		String title;
+		while ((title = readLine(in)) != null) {
+			byte[] doc = new byte[Integer.parseInt(readLine(in))];
+			readFully(in, doc);
+
+			String status = "OK";
+			ByteArrayOutputStream result = new ByteArrayOutputStream();
+			try {
+				XsltTransformer transformer = stylesheet.load();
+				transformer.setParameter(new QName("title"), new XdmAtomicValue(title));
+				transformer.setSource(new StreamSource(new ByteArrayInputStream(doc)));
+				Serializer serializer = processor.newSerializer(result);
+				transformer.setDestination(serializer);
+				transformer.transform();
+			} catch (SaxonApiException e) {
+				status = "ERR";
+				result.reset();
+				result.write(String.valueOf(e.getMessage()).getBytes("UTF-8"));
+			}
+
+			out.write((status + " " + result.size() + "\n").getBytes("UTF-8"));
+			result.writeTo(out);
+			out.flush();
+		}
+	}
+
+	/**
+	 * Read a UTF-8 line (without its \n), or null at the end of the stream.
+	 */
+	private static String readLine(InputStream in) throws IOException {
+		ByteArrayOutputStream line = new ByteArrayOutputStream();
+		int b = in.read();
+		if (b == -1) return null;
+		while (b != '\n') {
+			if (b == -1) throw new EOFException();
+			line.write(b);
+			b = in.read();
+		}
+		return line.toString("UTF-8");
+	}
+
+	private static void readFully(InputStream in, byte[] buf) throws IOException {
+		int off = 0;
+		while (off < buf.length) {
+			int n = in.read(buf, off, buf.length - off);
+			if (n == -1) throw new EOFException();
+			off += n;
+		}
+	}
+}